@@ -0,0 +1,374 @@
+"""Benchmark di sentinel.py e StudyTracker su storici sintetici di varie taglie.
+
+Uso (dalla radice del repository):
+
+    python -m benchmarks.bench                       # taglie S e M
+    python -m benchmarks.bench --taglie S,M,L --salva risultati.json
+    python -m benchmarks.bench --baseline risultati.json --tolleranza 0.5
+    python -m benchmarks.bench --calibra benchmarks/soglie.json
+
+Per ogni taglia genera in una cartella temporanea i vecchi file
+(sentinel_studio_log.txt, chat_ids.json, study_log.json), li fa importare
+come al primo avvio e misura le operazioni principali: latenza (mediana e
+p95 su più ripetizioni) e picco di memoria (tracemalloc, su un'esecuzione a
+parte). Esce con codice 1 se una misura supera le soglie di soglie.json o
+peggiora oltre la tolleranza rispetto a una baseline salvata.
+
+Le soglie si ricavano dalle misure con `--calibra`: MOLTIPLICATORE_MS volte
+la mediana e MOLTIPLICATORE_KB volte il picco. Fanno eccezione le
+operazioni di SOGLIE_FISSE (fsync e primo import), che dipendono dal disco
+e tengono il limite largo già scritto nel file.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+from benchmarks.bot_finto import BotFinto, update_finto
+from benchmarks.generatori import scrivi_chat_ids, scrivi_log_studio, scrivi_piano, scrivi_study_log
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOGLIE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soglie.json")
+
+# chat, giorni di storia, risposte ai poll per chat al giorno, sessioni desktop al giorno
+Taglia = namedtuple("Taglia", ["chat", "giorni", "risposte", "sessioni"])
+TAGLIE = {
+    "S": Taglia(chat=100, giorni=90, risposte=4, sessioni=3),
+    "M": Taglia(chat=1000, giorni=365, risposte=4, sessioni=3),
+    "L": Taglia(chat=3000, giorni=3 * 365, risposte=4, sessioni=3),
+}
+
+Risultato = namedtuple("Risultato", ["taglia", "operazione", "ripetizioni", "mediana_ms", "p95_ms", "picco_kb"])
+
+
+# ─── Misura ─────────────────────────────────────────────────────────────────────
+def _picco_kb(funzione) -> float:
+    tracemalloc.start()
+    try:
+        funzione()
+        _, picco = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return picco / 1024
+
+
+def misura(taglia: str, nome: str, funzione, ripetizioni: int, prepara=None) -> Risultato:
+    """Un'esecuzione sotto tracemalloc (fa anche da riscaldamento), poi le ripetizioni cronometrate.
+
+    `prepara`, se c'è, viene chiamata prima di ogni esecuzione e non è misurata.
+    """
+    if prepara:
+        prepara()
+    picco = _picco_kb(funzione)
+    tempi = []
+    for _ in range(ripetizioni):
+        if prepara:
+            prepara()
+        t0 = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - t0) * 1000)
+    tempi.sort()
+    p95 = tempi[min(len(tempi) - 1, int(0.95 * len(tempi)))]
+    r = Risultato(taglia, nome, ripetizioni, round(statistics.median(tempi), 3), round(p95, 3), round(picco, 1))
+    print(f"  {nome:<32} mediana {r.mediana_ms:>10.3f} ms   p95 {r.p95_ms:>10.3f} ms   picco {r.picco_kb:>10.1f} KB",
+          flush=True)
+    return r
+
+
+def misura_una_volta(taglia: str, nome: str, funzione, prepara) -> Risultato:
+    """Per operazioni non ripetibili sugli stessi dati (es. l'import al primo avvio).
+
+    `prepara()` ricrea i dati: un'esecuzione è cronometrata, una seconda
+    (su dati ricreati) misura il picco di memoria.
+    """
+    prepara()
+    t0 = time.perf_counter()
+    funzione()
+    ms = (time.perf_counter() - t0) * 1000
+    prepara()
+    picco = _picco_kb(funzione)
+    r = Risultato(taglia, nome, 1, round(ms, 3), round(ms, 3), round(picco, 1))
+    print(f"  {nome:<32} tempo   {r.mediana_ms:>10.3f} ms   {'':>18}   picco {r.picco_kb:>10.1f} KB", flush=True)
+    return r
+
+
+# ─── sentinel.py ────────────────────────────────────────────────────────────────
+def bench_sentinel(nome_taglia: str, taglia: Taglia, cartella: str, ripetizioni: int) -> list:
+    import sentinel as S
+    from utils.broadcast import Broadcaster
+    from utils.tabella_reminder import Blocco, TabellaReminder
+
+    sorgenti = os.path.join(cartella, "sorgenti")
+    os.makedirs(sorgenti)
+    chat = [100000 + i for i in range(taglia.chat)]
+    scrivi_chat_ids(os.path.join(sorgenti, S.CHAT_IDS_FILE), chat)
+    righe = scrivi_log_studio(os.path.join(sorgenti, S.STUDIO_LOG), chat, taglia.giorni, taglia.risposte)
+    print(f"[{nome_taglia}] sentinel: {taglia.chat} chat, {taglia.giorni} giorni, {righe} voci di studio", flush=True)
+
+    lavoro = os.path.join(cartella, "sentinel")
+
+    def chiudi():
+        # carica_stato() gira due volte: i thread del giro prima non devono
+        # restare vivi durante le misure successive
+        if S.renderer is not None:
+            S.renderer.chiudi()
+            S.renderer = None
+        if S.registro is not None:
+            S.registro.chiudi()
+            S.db.chiudi()
+            S.registro = S.db = None
+
+    def prepara_avvio():
+        chiudi()
+        os.chdir(cartella)
+        shutil.rmtree(lavoro, ignore_errors=True)
+        shutil.copytree(sorgenti, lavoro)
+        scrivi_piano(os.path.join(lavoro, "piano_normale.json"))
+        os.chdir(lavoro)
+        S.tabella = TabellaReminder()
+
+    risultati = [misura_una_volta(nome_taglia, "avvio (import + rollup)", S.carica_stato, prepara_avvio)]
+
+    bot = BotFinto()
+    S.bot = bot
+    S.broadcaster = Broadcaster(bot, global_rate=1e9, per_chat_rate=1e9, per_chat_burst=1e9)
+    rnd = random.Random(1)
+    try:
+        def status():
+            update, context = update_finto(rnd.choice(chat))
+            S.status(update, context)
+
+        def verifica():
+            S.verifica_proposta_adattamento(rnd.choice(chat))
+
+        def scoring():
+            S.registra_scoring(rnd.choice(chat), rnd.choice(("si", "no")))
+
+        blocco = Blocco("normale", "08:30", "📚 Studio blocco 1")
+
+        png = os.path.join(lavoro, "rendering.png")
+
+        def reminder():
+            S.manda_reminder({cid: [blocco] for cid in chat})
+
+        risultati += [
+            misura(nome_taglia, "status", status, ripetizioni * 20),
+            misura(nome_taglia, "verifica_proposta_adattamento", verifica, ripetizioni * 20),
+            misura(nome_taglia, "risposta poll (scrittura)", scoring, ripetizioni * 20),
+            misura(nome_taglia, "controllo_meta_giornata", S.controllo_meta_giornata, ripetizioni),
+            misura(nome_taglia, "manda_reminder (fan-out)", reminder, ripetizioni),
+            misura(nome_taglia, "grafico_giornaliero", S.genera_grafico_giornaliero, ripetizioni),
+            misura(nome_taglia, "grafico_settimanale", S.genera_grafico_settimanale, ripetizioni),
+            # senza cache: solo il renderer (modello riusato, dati nuovi a ogni giro)
+            misura(nome_taglia, "rendering giornaliero",
+                   lambda: S.renderer.giornaliero(png, "2025-01-01", [rnd.randint(0, 60) for _ in range(24)]),
+                   ripetizioni),
+            misura(nome_taglia, "rendering settimanale",
+                   lambda: S.renderer.settimanale(png, [rnd.randint(0, 600) for _ in range(7)]),
+                   ripetizioni),
+        ]
+    finally:
+        S.broadcaster.shutdown()
+        chiudi()
+        os.chdir(cartella)
+    return risultati
+
+
+# ─── StudyTracker ───────────────────────────────────────────────────────────────
+def bench_tracker(nome_taglia: str, taglia: Taglia, cartella: str, ripetizioni: int) -> list:
+    sys.path.insert(0, os.path.join(RADICE, "studytimer"))
+    from tracker import StudyTracker
+
+    sorgente = os.path.join(cartella, "study_log.json")
+    n = scrivi_study_log(sorgente, taglia.giorni, taglia.sessioni)
+    print(f"[{nome_taglia}] tracker: {taglia.giorni} giorni, {n} sessioni", flush=True)
+    lavoro = os.path.join(cartella, "tracker")
+    journal = os.path.join(lavoro, "study_log.jsonl")
+    tracker = None
+
+    def prepara_migrazione():
+        shutil.rmtree(lavoro, ignore_errors=True)
+        os.makedirs(lavoro)
+        shutil.copy(sorgente, os.path.join(lavoro, "study_log.json"))
+
+    def migra():
+        StudyTracker(journal)
+
+    def prepara_freddo():
+        nonlocal tracker
+        rollup = os.path.join(lavoro, "study_log.rollup.json")
+        if os.path.exists(rollup):
+            os.remove(rollup)
+        tracker = StudyTracker(journal)
+
+    def totali():
+        tracker.daily_total()
+        tracker.weekly_total()
+        tracker.monthly_total()
+        tracker.yearly_total()
+
+    def stop():
+        tracker.start()
+        tracker.stop()
+
+    risultati = [misura_una_volta(nome_taglia, "tracker: migrazione log", migra, prepara_migrazione)]
+    risultati.append(misura(nome_taglia, "tracker: totali a freddo", totali, ripetizioni, prepara_freddo))
+    prepara_freddo()
+    totali()  # rollup caricato: da qui in poi solo lookup
+    risultati += [
+        misura(nome_taglia, "tracker: totali", totali, ripetizioni * 20),
+        misura(nome_taglia, "tracker: stop", stop, ripetizioni * 20),
+    ]
+    return risultati
+
+
+# ─── Soglie e regressioni ───────────────────────────────────────────────────────
+MOLTIPLICATORE_MS = 10  # margine per macchine e dischi più lenti di quella di calibrazione
+MOLTIPLICATORE_KB = 2   # la memoria varia poco tra una macchina e l'altra
+MINIMO_MS = 0.01        # sotto questo la misura è solo rumore del timer
+MINIMO_KB = 16
+# dominate da fsync o dall'import al primo avvio: limiti larghi fissati a mano
+SOGLIE_FISSE = {"avvio (import + rollup)", "tracker: migrazione log", "tracker: stop"}
+
+
+def _arrotonda(valore: float) -> float:
+    """Per eccesso a due cifre significative (0.0312 -> 0.032, 1234 -> 1300)."""
+    if valore <= 0:
+        return 0
+    passo = 10 ** (math.floor(math.log10(valore)) - 1)
+    arrotondato = math.ceil(round(valore / passo, 6)) * passo
+    return int(arrotondato) if arrotondato >= 10 else round(arrotondato, 6)
+
+
+def calibra_soglie(risultati: list, attuali: dict) -> dict:
+    """Soglie ricavate dalle misure; le operazioni di SOGLIE_FISSE e quelle non misurate restano come in `attuali`."""
+    soglie = {taglia: dict(ops) for taglia, ops in attuali.items()}
+    for r in risultati:
+        fissa = attuali.get(r.taglia, {}).get(r.operazione)
+        if r.operazione in SOGLIE_FISSE and fissa:
+            soglie.setdefault(r.taglia, {})[r.operazione] = fissa
+            continue
+        soglie.setdefault(r.taglia, {})[r.operazione] = {
+            "mediana_ms": _arrotonda(max(r.mediana_ms * MOLTIPLICATORE_MS, MINIMO_MS)),
+            "picco_kb": _arrotonda(max(r.picco_kb * MOLTIPLICATORE_KB, MINIMO_KB)),
+        }
+    return soglie
+
+
+def scrivi_soglie(path: str, soglie: dict) -> None:
+    """soglie.json con una riga per operazione, colonne allineate."""
+    larghezza = max(len(op) for ops in soglie.values() for op in ops) + 4
+    righe = ["{"]
+    for i, (taglia, ops) in enumerate(soglie.items()):
+        righe.append(f'  "{taglia}": {{')
+        colonna = max(len(str(v["mediana_ms"])) for v in ops.values()) + 1
+        for j, (op, v) in enumerate(ops.items()):
+            ms = f'{v["mediana_ms"]},'.ljust(colonna + 1)
+            virgola = "," if j < len(ops) - 1 else ""
+            chiave = f'"{op}":'.ljust(larghezza)
+            righe.append(f'    {chiave}{{"mediana_ms": {ms} "picco_kb": {v["picco_kb"]}}}{virgola}')
+        righe.append("  }" + ("," if i < len(soglie) - 1 else ""))
+    righe.append("}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(righe) + "\n")
+
+
+def verifica_soglie(risultati: list, soglie: dict) -> list:
+    """Misure oltre i limiti assoluti di soglie.json ({taglia: {operazione: {mediana_ms, picco_kb}}})."""
+    errori = []
+    for r in risultati:
+        limiti = soglie.get(r.taglia, {}).get(r.operazione, {})
+        for campo in ("mediana_ms", "p95_ms", "picco_kb"):
+            if campo in limiti and getattr(r, campo) > limiti[campo]:
+                errori.append(f"{r.taglia} {r.operazione}: {campo} {getattr(r, campo)} > soglia {limiti[campo]}")
+    return errori
+
+
+def confronta_baseline(risultati: list, baseline: list, tolleranza: float,
+                       minimo_ms: float = 2.0, minimo_kb: float = 64.0) -> list:
+    """Misure peggiorate di oltre `tolleranza` (0.5 = +50%) rispetto alla baseline.
+
+    Differenze assolute sotto `minimo_ms` / `minimo_kb` sono rumore e non contano.
+    """
+    base = {(b["taglia"], b["operazione"]): b for b in baseline}
+    errori = []
+    for r in risultati:
+        b = base.get((r.taglia, r.operazione))
+        if not b:
+            continue
+        for campo, minimo in (("mediana_ms", minimo_ms), ("picco_kb", minimo_kb)):
+            nuovo, vecchio = getattr(r, campo), b[campo]
+            if nuovo > vecchio * (1 + tolleranza) and nuovo - vecchio > minimo:
+                errori.append(f"{r.taglia} {r.operazione}: {campo} {vecchio} -> {nuovo} "
+                              f"(+{(nuovo / vecchio - 1) * 100 if vecchio else float('inf'):.0f}%)")
+    return errori
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark di sentinel.py e StudyTracker.")
+    parser.add_argument("--taglie", default="S,M", help=f"taglie da misurare tra {','.join(TAGLIE)}")
+    parser.add_argument("--ripetizioni", type=int, default=5, help="ripetizioni per le operazioni lente")
+    parser.add_argument("--soglie", default=SOGLIE_FILE, help="file JSON con i limiti assoluti")
+    parser.add_argument("--baseline", help="risultati salvati con cui confrontarsi")
+    parser.add_argument("--tolleranza", type=float, default=0.5, help="peggioramento ammesso sulla baseline")
+    parser.add_argument("--salva", help="scrive i risultati in questo file JSON")
+    parser.add_argument("--solo", choices=("sentinel", "tracker"), help="misura solo una delle due parti")
+    parser.add_argument("--calibra", metavar="FILE",
+                        help="riscrive FILE con le soglie ricavate da queste misure (e non le verifica)")
+    opzioni = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.path.insert(0, RADICE)
+    origine = os.getcwd()
+    risultati = []
+    for nome in opzioni.taglie.split(","):
+        taglia = TAGLIE[nome.strip()]
+        cartella = tempfile.mkdtemp(prefix=f"bench_{nome}_")
+        try:
+            if opzioni.solo != "tracker":
+                risultati += bench_sentinel(nome, taglia, cartella, opzioni.ripetizioni)
+            if opzioni.solo != "sentinel":
+                risultati += bench_tracker(nome, taglia, cartella, opzioni.ripetizioni)
+        finally:
+            os.chdir(origine)
+            shutil.rmtree(cartella, ignore_errors=True)
+
+    if opzioni.salva:
+        with open(opzioni.salva, "w", encoding="utf-8") as f:
+            json.dump({"data": datetime.now().isoformat(timespec="seconds"),
+                       "risultati": [r._asdict() for r in risultati]}, f, indent=2, ensure_ascii=False)
+
+    if opzioni.calibra:
+        attuali = {}
+        if os.path.exists(opzioni.calibra):
+            with open(opzioni.calibra, "r", encoding="utf-8") as f:
+                attuali = json.load(f)
+        scrivi_soglie(opzioni.calibra, calibra_soglie(risultati, attuali))
+        print(f"Soglie scritte in {opzioni.calibra}")
+        return 0
+
+    errori = []
+    if opzioni.soglie and os.path.exists(opzioni.soglie):
+        with open(opzioni.soglie, "r", encoding="utf-8") as f:
+            errori += verifica_soglie(risultati, json.load(f))
+    if opzioni.baseline:
+        with open(opzioni.baseline, "r", encoding="utf-8") as f:
+            errori += confronta_baseline(risultati, json.load(f)["risultati"], opzioni.tolleranza)
+    for e in errori:
+        print(f"REGRESSIONE: {e}")
+    print("OK" if not errori else f"{len(errori)} regressioni")
+    return 1 if errori else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Bot finto: registra le chiamate alla Bot API senza rete."""
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+
+class BotFinto:
+    """Espone i metodi del `telegram.Bot` usati da sentinel.py.
+
+    Ogni chiamata attende `latenza` secondi (per simulare la rete) e ritorna
+    un oggetto con `message_id` e, per le foto, `photo[-1].file_id`.
+    """
+
+    defaults = None
+
+    def __init__(self, latenza: float = 0.0) -> None:
+        self.latenza = latenza
+        self.chiamate = {}
+        self._lock = threading.Lock()
+        self._id = itertools.count(1)
+
+    def _registra(self, metodo: str, **kwargs):
+        if self.latenza:
+            time.sleep(self.latenza)
+        with self._lock:
+            self.chiamate[metodo] = self.chiamate.get(metodo, 0) + 1
+            message_id = next(self._id)
+        foto = kwargs.get("photo")
+        file_id = foto if isinstance(foto, str) else f"file-{message_id}"
+        return SimpleNamespace(message_id=message_id, photo=[SimpleNamespace(file_id=file_id)])
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._registra("send_message", chat_id=chat_id, text=text, **kwargs)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self._registra("send_photo", chat_id=chat_id, photo=photo, **kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        return self._registra("edit_message_text", **kwargs)
+
+    def answer_callback_query(self, *args, **kwargs):
+        return self._registra("answer_callback_query", **kwargs)
+
+    def azzera(self) -> None:
+        with self._lock:
+            self.chiamate.clear()
+
+
+def update_finto(chat_id: int, args=None):
+    """(update, context) minimi per chiamare un handler di comando."""
+    risposte = []
+    messaggio = SimpleNamespace(reply_text=lambda testo, **kw: risposte.append(testo))
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=messaggio)
+    return update, SimpleNamespace(args=args or [], risposte=risposte)
@@ -0,0 +1,69 @@
+"""Generatori di storici sintetici (vecchio formato) per i benchmark."""
+import json
+import random
+from datetime import datetime, timedelta
+
+# orari dei blocchi "Studio" a cui si risponde al poll
+ORARI_POLL = ["08:30", "09:30", "10:30", "11:30", "14:30", "15:30", "16:30", "17:30", "21:00", "22:00"]
+
+
+def scrivi_chat_ids(path: str, chat: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chat, f)
+
+
+def scrivi_log_studio(path: str, chat: list, giorni: int, risposte_al_giorno: int,
+                      fine: datetime = None, seed: int = 0) -> int:
+    """Scrive un sentinel_studio_log.txt di `giorni` giorni fino a `fine` (oggi).
+
+    Ogni chat risponde a `risposte_al_giorno` poll al giorno scelti tra
+    ORARI_POLL, con circa un "No" (0 minuti) ogni tre risposte. Ritorna il
+    numero di righe scritte.
+    """
+    rnd = random.Random(seed)
+    fine = fine or datetime.now()
+    inizio = (fine - timedelta(days=giorni - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    righe = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for g in range(giorni):
+            giorno = inizio + timedelta(days=g)
+            for cid in chat:
+                for orario in sorted(rnd.sample(ORARI_POLL, risposte_al_giorno)):
+                    h, m = map(int, orario.split(":"))
+                    ts = giorno.replace(hour=h, minute=m, second=rnd.randrange(60))
+                    if ts > fine:
+                        continue
+                    minuti = 0 if rnd.random() < 0.33 else 30
+                    f.write(f"{ts:%Y-%m-%d %H:%M:%S} - chat_id: {cid} - minuti_studio: {minuti}\n")
+                    righe += 1
+    return righe
+
+
+def scrivi_study_log(path: str, giorni: int, sessioni_al_giorno: int,
+                     fine: datetime = None, seed: int = 0) -> int:
+    """Scrive un study_log.json (array JSON, il vecchio formato del tracker desktop)."""
+    rnd = random.Random(seed)
+    fine = fine or datetime.now()
+    inizio = (fine - timedelta(days=giorni - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    sessioni = []
+    for g in range(giorni):
+        t = inizio + timedelta(days=g, hours=8)
+        for _ in range(sessioni_al_giorno):
+            t += timedelta(minutes=rnd.randrange(10, 120))
+            durata = rnd.randrange(15, 110)
+            end = t + timedelta(minutes=durata, seconds=rnd.randrange(60))
+            if end > fine:
+                break
+            sessioni.append({"start": t.isoformat(), "end": end.isoformat(),
+                             "minutes": (end - t).total_seconds() / 60})
+            t = end
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(sessioni, f)
+    return len(sessioni)
+
+
+def scrivi_piano(path: str) -> None:
+    """Un piano con un blocco "Studio" a ogni orario di ORARI_POLL."""
+    blocchi = [{"ora": o, "testo": f"📚 Studio blocco {i + 1}"} for i, o in enumerate(ORARI_POLL)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"blocchi": blocchi}, f, ensure_ascii=False)
@@ -1,3 +1,5 @@
+import os
+
 from studytimer.tracker import StudyTracker
 from studytimer.telegram_notifier import TelegramNotifier
 from studytimer.gui import StudyGUI
@@ -9,8 +11,26 @@ def main() -> None:
     notifier = TelegramNotifier()
     scheduler = StudyScheduler(tracker, notifier)
     scheduler.start()
+    sensors = None
+    if os.environ.get("MQTT_HOST"):
+        from studytimer.sensors import (DEFAULT_THRESHOLDS, DEFAULT_TOPICS, SensorIngestor,
+                                        StudyDetector, mqtt_client)
+        detector = StudyDetector(
+            tracker, DEFAULT_THRESHOLDS,
+            on_start=lambda: notifier.send_message("Sto studiando"),
+            on_stop=lambda minutes: notifier.send_message(f"Ho studiato {int(minutes)} minuti"),
+        )
+        client = mqtt_client(os.environ["MQTT_HOST"], int(os.environ.get("MQTT_PORT", 1883)))
+        sensors = SensorIngestor(client, detector, DEFAULT_TOPICS)
+        sensors.start()
     app = StudyGUI(tracker, notifier)
-    app.run()
+    try:
+        app.run()
+    finally:
+        if sensors:
+            sensors.stop()
+        # unsent messages go to the spool and are retried on the next start
+        notifier.close()
 
 
 if __name__ == "__main__":
@@ -1,333 +1,315 @@
+import time
+_T_AVVIO = time.perf_counter()  # per misurare import → bot pronto
+
 from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Updater, CommandHandler, CallbackContext, Dispatcher, CallbackQueryHandler
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
 from pytz import timezone
-import time
+import argparse
+import asyncio
+import threading
 import logging
-import json
-import os
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import re
-
-# per tenere in memoria l’ultima riga proposta per annullamento
-pending_annulla = {}  # chat_id -> line_text
-
-# file dove salvo i conteggi di timeout per ogni chat
-MISSES_FILE = "misses.json"
-
-# carico (o inizializzo) il contatore di “missed prompts”
-if os.path.exists(MISSES_FILE):
-    with open(MISSES_FILE, "r", encoding="utf-8") as f:
-        misses = json.load(f)
-else:
-    misses = {}   # chat_id (str) -> int
-
-# ─── Configurazione logging ─────────────────────────────────────────────────────
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# ─── Caricamento token & init Bot + Scheduler ──────────────────────────────────
-with open("token.txt", "r") as f:
-    TOKEN = f.read().strip()
-logging.info("Token caricato correttamente.")
-
-bot = Bot(token=TOKEN)
-scheduler = BackgroundScheduler()
+from utils import metriche, rollup
+from utils.broadcast import Broadcaster, FileIdCache
+from utils.cache_grafici import CacheGrafici
+from utils.db import SentinelDB
+from utils.grafici import RendererGrafici
+from utils.partizioni import Partizioni
+from utils.piano import MODALITA, PianoCache, STATO_FILE, blocco_corrente
+from utils.scadenze import RuotaTimer
+from utils.stato_chat import STATO_CHAT_FILE, StatoChat
+from utils.studio_store import StudioStore, formatta_voce
+from utils.tabella_reminder import TabellaReminder
+from utils.write_behind import RegistroChat
 
 # ─── Percorsi e costanti ────────────────────────────────────────────────────────
+TOKEN_FILE    = "token.txt"
+DB_FILE       = "sentinel.db"
+# vecchi file di stato, importati una volta in DB_FILE al primo avvio
 CHAT_IDS_FILE = "chat_ids.json"
+MISSES_FILE   = "misses.json"
+STUDIO_LOG    = "sentinel_studio_log.txt"
+REMINDER_LOG  = "sentinel_log.txt"
+FILE_IDS_FILE = "file_ids.json"
+WEBHOOK_SECRET_FILE = "webhook_secret.txt"  # secret token del webhook, generato al primo uso
+AVVII_LOG     = "sentinel_avvii.txt"
 REPORT_DIR    = "report_settimanali"
 DAILY_DIR     = "report_giornalieri"
+ARCHIVIO_DIR  = "archivio"  # mesi di log archiviati (jsonl.gz)
 WEEKDAYS      = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
-
-os.makedirs(REPORT_DIR, exist_ok=True)
-os.makedirs(DAILY_DIR, exist_ok=True)
+PIANO_WATCH_SECONDI = 30
+STATO_CHAT_SECONDI = 300  # ogni quanto salvare l'istantanea dello stato per chat
+RECUPERO_MINUTI = 5  # minuti di reminder recuperati se il dispatcher parte in ritardo
+POLL_SCADENZA_MINUTI = 30  # un poll senza risposta entro un blocco conta come miss
+TESTO_POLL_SCADUTO = "⌛ Poll scaduto: nessuna risposta, conteggiato come miss."
+
+# ─── Stato del processo ─────────────────────────────────────────────────────────
+# L'import del modulo non ha effetti collaterali: tutto viene caricato da
+# carica_stato() e avviato da main().
+TOKEN = None
+bot = None
+broadcaster = None
+scheduler = None
+updater = None
+client_async = None  # ClientBotAsync, solo con --runtime asyncio
+runtime = None       # RuntimeAsync, solo con --runtime asyncio
+webhook = None       # ServerWebhook, solo con --webhook
+server_metriche = None  # ServerMetriche, solo con --metriche
+
+db = None        # SentinelDB: chat, modalità per chat, miss, studio, reminder
+registro = None  # chat attive e miss in memoria, salvati su db in differita
+file_ids = None  # file_id Telegram dei grafici già caricati
+studio = None    # query sulle registrazioni di studio
+stato_chat = None  # StatoChat: blocchi vuoti di fila di oggi per chat
+partizioni = None  # manifest mensile e archiviazione dei log
+grafici_settimanali = None  # CacheGrafici su REPORT_DIR
+grafici_giornalieri = None  # CacheGrafici su DAILY_DIR
+renderer = None  # RendererGrafici: matplotlib solo sul suo thread
+
+# piani di studio compilati, riletti da disco solo se cambia l'mtime
+piani = PianoCache()
+# minuto del giorno -> chat e blocchi da inviare, letta dal dispatcher ogni minuto
+tabella = TabellaReminder()
+ultimo_minuto = None  # minuto (epoch // 60) già servito dal dispatcher
+reminder_sync_lock = threading.Lock()
+
+# per tenere in memoria l’ultima voce proposta per annullamento
+pending_annulla = {}  # chat_id -> Voce
 
 # ─── Stato in memoria dei poll aperti ───────────────────────────────────────────
 pending_poll_message = {}  # chat_id -> message_id
-
-# ─── Caricamento chat_id esistenti ─────────────────────────────────────────────
-if os.path.exists(CHAT_IDS_FILE):
-    with open(CHAT_IDS_FILE, "r", encoding="utf-8") as f:
-        CHAT_IDS = set(json.load(f))
-    logging.info("Chat ID caricati da file.")
-else:
-    CHAT_IDS = set()
-
-def salva_chat_ids():
-    """Salva su file se la lista di chat_id è cambiata."""
-    try:
-        if os.path.exists(CHAT_IDS_FILE):
-            with open(CHAT_IDS_FILE, "r", encoding="utf-8") as f:
-                old = set(json.load(f))
-            if old == CHAT_IDS:
-                return
-        with open(CHAT_IDS_FILE, "w", encoding="utf-8") as f:
-            json.dump(list(CHAT_IDS), f)
-        logging.info("Chat ID salvati su file.")
-    except Exception as e:
-        logging.error(f"Errore salvataggio chat_id: {e}")
-
-def carica_piano_studio():
-    """Ritorna la lista di (orario, testo) dal piano corrente."""
-    stato_file = "sentinel_piano_corrente.json"
-    modalità = "normale"
-    if os.path.exists(stato_file):
-        try:
-            with open(stato_file, "r", encoding="utf-8") as f:
-                dati = json.load(f)
-            modalità = dati.get("modalità", "normale")
-        except Exception as e:
-            logging.warning(f"Stato piano corrotto ({e}), uso 'normale'.")
-    nome_file = f"piano_{modalità}.json"
-    if not os.path.exists(nome_file):
-        nome_file = "piano_normale.json"
+scadenze_poll = RuotaTimer()  # chat_id -> message_id, con la scadenza del poll
+poll_lock = threading.Lock()  # risposta, nuovo poll e scadenza non si accavallano
+
+def registra_poll(cid, message_id):
+    """Tiene traccia del poll inviato; un poll precedente ancora aperto scade subito."""
+    with poll_lock:
+        precedente = pending_poll_message.get(cid)
+        pending_poll_message[cid] = message_id
+        scadenze_poll.aggiungi(cid, POLL_SCADENZA_MINUTI * 60, message_id)
+    if precedente is not None and precedente != message_id:
+        segna_poll_scaduto(cid, precedente)
+
+def chiudi_poll(cid):
+    """Il poll della chat ha avuto risposta: niente più scadenza."""
+    with poll_lock:
+        pending_poll_message.pop(cid, None)
+        scadenze_poll.rimuovi(cid)
+
+def scadi_poll(cid, message_id):
+    """Scadenza del timer: conta solo se il poll è ancora quello aperto (non risposto né sostituito)."""
+    with poll_lock:
+        if pending_poll_message.get(cid) != message_id:
+            return
+        del pending_poll_message[cid]
+    segna_poll_scaduto(cid, message_id)
+
+def segna_poll_scaduto(cid, message_id):
+    """Conta il miss e toglie i pulsanti al messaggio; un errore di Telegram qui non blocca chi chiama."""
+    n = registro.incrementa_misses(cid)
+    logging.info(f"Poll {message_id} di {cid} scaduto: {n} miss.")
     try:
-        with open(nome_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        broadcaster.chiama("edit_message_text", cid, message_id=message_id, text=TESTO_POLL_SCADUTO)
     except Exception as e:
-        logging.error(f"Errore caricamento {nome_file}: {e}")
-        return []
-    raw = data.get("blocchi") if isinstance(data, dict) else data if isinstance(data, list) else []
-    piano = []
-    for entry in raw:
-        if isinstance(entry, list) and len(entry) == 2:
-            piano.append((entry[0], entry[1]))
-        elif isinstance(entry, dict):
-            o = entry.get("ora"); t = entry.get("testo")
-            if o and t:
-                piano.append((o, t))
-    return piano
+        logging.warning(f"Poll {message_id} di {cid}: impossibile segnarlo come scaduto: {e}")
+
+def controlla_scadenze_poll():
+    """Job periodico: fa scadere i poll rimasti senza risposta."""
+    scaduti = dict(scadenze_poll.avanza())
+    if scaduti:
+        broadcaster.broadcast(scaduti, lambda cid: scadi_poll(cid, scaduti[cid]), "poll scaduti")
+
+def carica_stato():
+    """Apre il database (importando i vecchi file al primo avvio) e la cache dei file_id."""
+    global db, registro, file_ids, studio, stato_chat, partizioni, grafici_settimanali, grafici_giornalieri, renderer
+    renderer = RendererGrafici(WEEKDAYS)
+    file_ids = FileIdCache(FILE_IDS_FILE)
+    # i PNG potati dalla cache si portano via anche il loro file_id
+    grafici_settimanali = CacheGrafici(REPORT_DIR, rimossi=file_ids.scarta)
+    grafici_giornalieri = CacheGrafici(DAILY_DIR, rimossi=file_ids.scarta)
+
+    db = SentinelDB(DB_FILE)
+    db.importa_file_legacy(CHAT_IDS_FILE, MISSES_FILE, STATO_FILE, STUDIO_LOG, REMINDER_LOG)
+    registro = RegistroChat(db)
+    studio = StudioStore(db)
+    partizioni = Partizioni(db, ARCHIVIO_DIR)
+    # primo avvio con i rollup: li calcolo da voci live e archiviate
+    rollup.assicura(db, partizioni.voci_archiviate())
+    stato_chat = StatoChat(studio, STATO_CHAT_FILE)
+    stato_chat.carica()
 
 def start(update: Update, context: CallbackContext):
     """/start: registra la chat e conferma."""
     cid = update.effective_chat.id
-    CHAT_IDS.add(cid)
-    salva_chat_ids()
+    registro.imposta_chat(cid, True)
+    sincronizza_chat(cid)
     logging.info(f"Nuovo chat_id: {cid}")
     update.message.reply_text("Bot attivo. Ti invierò i reminder per lo studio.")
 
-def manda_reminder(orario, messaggio):
-    """Invia il reminder, mostra attività successiva e chiede Sì/No."""
+def tastiera(prefisso):
+    """Tastiera inline Sì/No con callback "<prefisso>_si" / "<prefisso>_no"."""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("Sì", callback_data=f"{prefisso}_si"),
+        InlineKeyboardButton("No", callback_data=f"{prefisso}_no")
+    ]])
+
+def testo_reminder(modalità, orario, messaggio):
+    """Testo del reminder con l'attività successiva del piano, se c'è."""
+    piano = piani.piano(modalità)
+    idx = piano.indice.get(orario)
+    if idx is not None and piano.prossimo[idx]:
+        return f"{messaggio}\n\n{piano.prossimo[idx]}"
+    return messaggio
+
+def manda_reminder(dovuti):
+    """Invia i blocchi dovuti (chat_id -> [Blocco]) in un solo broadcast, chiedendo Sì/No dopo lo studio."""
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    piano = carica_piano_studio()
-    idx = next((i for i,(o,_) in enumerate(piano) if o == orario), None)
-    if idx is not None and idx+1 < len(piano):
-        po, pt = piano[idx+1]
-        testo = f"{messaggio}\n\n⏳ Hai tempo fino alle *{po}*, poi *{pt}*."
-    else:
-        testo = messaggio
-
-    for cid in CHAT_IDS:
-        sent = bot.send_message(chat_id=cid, text=testo, parse_mode='Markdown')
-        with open("sentinel_log.txt","a",encoding="utf-8") as lg:
-            lg.write(f"{now} - chat_id: {cid} - reminder: {messaggio}\n")
-        if "Studio" in messaggio:
-            poll = bot.send_message(
-                chat_id=cid,
-                text="Stai studiando?",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("Sì", callback_data="scoring_si"),
-                    InlineKeyboardButton("No", callback_data="scoring_no")
-                ]])
-            )
-            pending_poll_message[cid] = poll.message_id
+    # un testo per blocco distinto, non uno per chat
+    testi = {b: testo_reminder(*b) for blocchi in dovuti.values() for b in blocchi}
+
+    def invia_a(cid):
+        for b in dovuti[cid]:
+            broadcaster.chiama("send_message", cid, text=testi[b], parse_mode='Markdown')
+            db.registra_reminder(now, cid, b.testo)
+            if "Studio" in b.testo:
+                poll = broadcaster.chiama("send_message", cid, text="Stai studiando?",
+                                          reply_markup=tastiera("scoring"))
+                registra_poll(cid, poll.message_id)
+
+    broadcaster.broadcast(dovuti, invia_a, f"reminder {now[11:16]}")
+
+def reminder_dovuti():
+    """Blocchi (chat_id -> [Blocco]) dei minuti trascorsi dall'ultimo giro del dispatcher.
+
+    Se il job parte in ritardo recupera al più RECUPERO_MINUTI minuti; due
+    giri nello stesso minuto non inviano nulla di doppio.
+    """
+    global ultimo_minuto
+    adesso = int(time.time() // 60)
+    inizio = adesso if ultimo_minuto is None else max(ultimo_minuto + 1, adesso - RECUPERO_MINUTI + 1)
+    ultimo_minuto = adesso
+    dovuti = {}
+    for e in range(inizio, adesso + 1):
+        t = datetime.fromtimestamp(e * 60, timezone('Europe/Rome'))
+        for cid, blocchi in tabella.dovuti(t.hour * 60 + t.minute).items():
+            dovuti.setdefault(cid, []).extend(blocchi)
+    return dovuti
+
+def dispatcher_reminder():
+    """Job di ogni minuto: invia i reminder dovuti in questo minuto."""
+    dovuti = reminder_dovuti()
+    if dovuti:
+        manda_reminder(dovuti)
 
 def risposta_scoring(update: Update, context: CallbackContext):
     q = update.callback_query
     q.answer()
 
     cid = q.message.chat.id
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     resp = q.data.split("_")[1]  # "si" o "no"
+    registra_scoring(cid, resp)
+
+    # aggiorno il messaggio Telegram
+    q.edit_message_text(text=f"Risposta registrata: {resp.upper()}")
+
+    verifica_proposta_adattamento(cid)
+
+def registra_scoring(cid, resp):
+    """Registra la risposta al poll: azzera i miss e salva 30 o 0 minuti."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # —–––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
     # 1) resetto il contatore dei miss per questa chat (se esiste)
-    key = str(cid)
-    if key in misses:
-        misses.pop(key)
-        with open(MISSES_FILE, "w", encoding="utf-8") as f:
-            json.dump(misses, f)
-    # —–––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+    chiudi_poll(cid)
+    registro.azzera_misses(cid)
 
     # 2) registro i minuti (30 o 0)
     minuti = 30 if resp == "si" else 0
-    with open("sentinel_studio_log.txt", "a", encoding="utf-8") as lg:
-        lg.write(f"{now} - chat_id: {cid} - minuti_studio: {minuti}\n")
+    stato_chat.aggiungi(cid, minuti, now)
 
-    # 3) aggiorno il messaggio Telegram
-    q.edit_message_text(text=f"Risposta registrata: {resp.upper()}")
+def serve_adattamento(chat_id):
+    """True se la chat ha 3 blocchi a zero di fila in giornata."""
+    oggi = datetime.now().strftime("%Y-%m-%d")
+    return stato_chat.vuoti_di_fila(chat_id, oggi) >= 3
 
-    verifica_proposta_adattamento(cid)
+TESTO_ADATTAMENTO = "3 blocchi vuoti! Vuoi un piano più leggero domani?"
 
 def verifica_proposta_adattamento(chat_id):
     """Se 3 blocchi a zero in giornata, propone piano più leggero."""
-    oggi = datetime.now().strftime("%Y-%m-%d")
-    cnt = 0
-    if os.path.exists("sentinel_studio_log.txt"):
-        with open("sentinel_studio_log.txt","r",encoding="utf-8") as f:
-            lines = [l for l in f if oggi in l and f"chat_id: {chat_id}" in l]
-        for l in reversed(lines):
-            if "minuti_studio: 0" in l:
-                cnt += 1
-            else:
-                break
-    if cnt >= 3:
-        bot.send_message(
-            chat_id=chat_id,
-            text="3 blocchi vuoti! Vuoi un piano più leggero domani?",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("Sì", callback_data="adatta_si"),
-                InlineKeyboardButton("No", callback_data="adatta_no")
-            ]])
-        )
+    if serve_adattamento(chat_id):
+        bot.send_message(chat_id=chat_id, text=TESTO_ADATTAMENTO, reply_markup=tastiera("adatta"))
+
+def applica_adattamento(cid, accetta):
+    """Passa la chat al piano più leggero se `accetta`; ritorna il testo di conferma."""
+    if not accetta:
+        return "Manteniamo piano attuale ✔️"
+    mod = db.modalita(cid)
+    nuovo = {"normale":"ridotto","ridotto":"superridotto"}.get(mod,"superridotto")
+    db.imposta_modalita(cid, nuovo)
+    sincronizza_chat(cid)
+    return f"Piano cambiato a {nuovo.upper()} ✔️"
 
 def risposta_adattamento(update: Update, context: CallbackContext):
     """Gestisce la scelta di adattare il piano dopo proposta."""
     q = update.callback_query; q.answer()
     cid = q.message.chat.id
-    stato = {"modalità": "normale"}
-    if os.path.exists("sentinel_piano_corrente.json"):
-        with open("sentinel_piano_corrente.json","r",encoding="utf-8") as f:
-            stato = json.load(f)
-    mod = stato.get("modalità","normale")
-    nuovo = {"normale":"ridotto","ridotto":"superridotto"}.get(mod,"superridotto")
-    if q.data == "adatta_si":
-        with open("sentinel_piano_corrente.json","w",encoding="utf-8") as f:
-            json.dump({"modalità":nuovo}, f)
-        bot.send_message(chat_id=cid, text=f"Piano cambiato a {nuovo.upper()} ✔️")
-    else:
-        bot.send_message(chat_id=cid, text="Manteniamo piano attuale ✔️")
+    bot.send_message(chat_id=cid, text=applica_adattamento(cid, q.data == "adatta_si"))
 
 def genera_grafico_settimanale():
-    log_file = "sentinel_studio_log.txt"
-    if not os.path.exists(log_file):
-        logging.info("Nessun log di studio per grafico settimanale.")
-        return
-
     now = datetime.now(timezone('Europe/Rome'))
     start = now - timedelta(days=6)
 
-    # inizializzo contatore per ciascun giorno della settimana (0=Lun ... 6=Dom)
-    giorni_tot = {i: 0 for i in range(7)}
-    total_minuti = 0
-
-    pattern = re.compile(
-        r'^(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - chat_id: \d+ - minuti_studio: (?P<min>\d+)$'
-    )
-
-    with open(log_file, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            m = pattern.match(line)
-            if not m:
-                continue
-
-            ts_str = m.group('ts')
-            minuti = int(m.group('min'))
-
-            try:
-                dt_naive = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                dt = timezone('Europe/Rome').localize(dt_naive)
-            except ValueError:
-                continue
-
-            if not (start <= dt <= now):
-                continue
+    # bucket giornalieri degli ultimi 7 giorni (oggi compreso)
+    per_giorno = rollup.intervallo(db, "day", start.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d"))
 
-            wd = dt.weekday()  # 0=Lun ... 6=Dom
-            giorni_tot[wd] += minuti
-            total_minuti += minuti
+    # minuti per ciascun giorno della settimana (0=Lun ... 6=Dom)
+    giorni_tot = [0] * 7
+    for i in range(7):
+        giorno = start + timedelta(days=i)
+        giorni_tot[giorno.weekday()] = per_giorno.get(giorno.strftime("%Y-%m-%d"), 0)
+    total_minuti = sum(giorni_tot)
 
     if total_minuti == 0:
         logging.info("Nessun dato utile (tutti 0) per grafico settimanale.")
         return
 
-    # preparo etichette e valori in ore
-    labels = WEEKDAYS
-    vals = [giorni_tot[i] / 60 for i in range(7)]
-
-    # disegno a line plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(range(7), vals, marker="o", linestyle="-")
-    plt.xticks(range(7), labels)
-    plt.xlabel("Giorno della settimana")
-    plt.ylabel("Ore di studio")
-    plt.title("Andamento settimanale studio (ultimi 7 giorni)")
-    plt.grid(alpha=0.3)
-    plt.tight_layout()
-
-    # salva in report_settimanali/
+    # in report_settimanali/, ridisegnato solo se i dati sono cambiati
     date_str = now.strftime("%Y-%m-%d")
-    out_file = os.path.join(REPORT_DIR, f"grafico_settimanale_{date_str}.png")
-    plt.savefig(out_file)
-    plt.close()
+    out_file = grafici_settimanali.ottieni(
+        "grafico_settimanale", date_str, giorni_tot,
+        lambda path: renderer.settimanale(path, giorni_tot)
+    )
 
     # calcolo totale ore/minuti settimanali
     ore, minuti = divmod(total_minuti, 60)
     caption = f"📊 Ultimi 7 giorni: hai studiato **{ore}h {minuti}m**"
 
     # invio
-    for cid in CHAT_IDS:
-        try:
-            with open(out_file, "rb") as img:
-                bot.send_photo(
-                    chat_id=cid,
-                    photo=img,
-                    caption=caption,
-                    parse_mode='Markdown'
-                )
-        except Exception as e:
-            logging.error(f"Errore inviando grafico settimanale a {cid}: {e}")
+    # un solo upload: le altre chat ricevono il file_id
+    broadcaster.broadcast_foto(
+        registro.chat_attive(), out_file, file_ids, "grafico settimanale",
+        caption=caption,
+        parse_mode='Markdown'
+    )
 
 
 def genera_grafico_giornaliero():
-    log_file = "sentinel_studio_log.txt"
-    if not os.path.exists(log_file):
-        logging.info("Nessun log di studio trovato per il grafico giornaliero.")
-        return
-
     oggi = datetime.now(timezone('Europe/Rome')).strftime("%Y-%m-%d")
-    # inizializzo tutti gli 0-23 a 0 minuti
-    ore_dict = {h: 0 for h in range(24)}
-    total_minuti = 0
-
-    # leggo il log e sommo i minuti nell'ora giusta
-    with open(log_file, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.startswith(oggi):
-                continue
-            # "YYYY-MM-DD HH:MM:SS - chat_id: xxx - minuti_studio: yy"
-            ts_str, _, rest = line.partition(" - chat_id")
-            dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-            minuti = int(rest.split(":")[-1])
-            ore_dict[dt.hour] += minuti
-            total_minuti += minuti
+
+    # minuti di oggi per ciascuna ora 0-23, dai bucket orari
+    per_ora = rollup.intervallo(db, "hour", f"{oggi}T00", f"{oggi}T23")
+    values = [per_ora.get(f"{oggi}T{h:02d}", 0) for h in range(24)]
+    total_minuti = rollup.totale(db, "day", oggi)
 
     if total_minuti == 0:
         logging.info("Nessuna attività di studio rilevata oggi.")
         return
 
-    # prepara dati per il plot
-    hours = list(ore_dict.keys())            # [0,1,2,...,23]
-    values = [ore_dict[h] for h in hours]    # minuti cumulati in quell’ora
-
-    # disegno
-    plt.figure(figsize=(10, 5))
-    plt.plot(hours, values, marker="o", linestyle="-")
-    plt.xticks(hours)
-    plt.xlabel("Ora del giorno")
-    plt.ylabel("Minuti di studio")
-    plt.title(f"Studio oggi ({oggi}) per fasce orarie")
-    plt.grid(alpha=0.3)
-    plt.tight_layout()
-
-    # salva in report_giornalieri/
-    grafico = os.path.join(DAILY_DIR, f"grafico_giornaliero_{oggi}.png")
-    plt.savefig(grafico)
-    plt.close()
+    # in report_giornalieri/, ridisegnato solo se i dati sono cambiati
+    grafico = grafici_giornalieri.ottieni(
+        "grafico_giornaliero", oggi, values,
+        lambda path: renderer.giornaliero(path, oggi, values)
+    )
     logging.info(f"Grafico giornaliero salvato in {grafico}")
 
     # calcolo totale ore/minuti
@@ -335,42 +317,40 @@ def genera_grafico_giornaliero():
     caption = f"📈 Oggi hai studiato **{ore}h {minuti}m**"
 
     # mando a tutti i chat_id
-    for cid in CHAT_IDS:
-        try:
-            with open(grafico, "rb") as img:
-                bot.send_photo(
-                    chat_id=cid,
-                    photo=img,
-                    caption=caption,
-                    parse_mode='Markdown'
-                )
-        except Exception as e:
-            logging.error(f"Errore inviando grafico giornaliero a {cid}: {e}")
+    # un solo upload: le altre chat ricevono il file_id
+    broadcaster.broadcast_foto(
+        registro.chat_attive(), grafico, file_ids, "grafico giornaliero",
+        caption=caption,
+        parse_mode='Markdown'
+    )
 
 
+def compatta_studio():
+    """Salva lo stato per chat (che include già gli annullamenti) e poi elimina le voci annullate."""
+    stato_chat.salva()
+    studio.compatta()
+
 def controllo_meta_giornata():
-    """Alle 12:00: avvisa se hai già studiato o no entro metà giornata."""
+    """Alle 12:00: avvisa ogni chat se ha già studiato o no entro metà giornata."""
     oggi = datetime.now().strftime("%Y-%m-%d")
-    tot = 0
-    if os.path.exists("sentinel_studio_log.txt"):
-        with open("sentinel_studio_log.txt","r",encoding="utf-8") as f:
-            for line in f:
-                if not line.startswith(oggi): continue
-                minuti = int(line.strip().split(" - ")[2].replace("minuti_studio: ",""))
-                tot += minuti
-    h, m = divmod(tot, 60)
-    for cid in CHAT_IDS:
+    per_chat = rollup.per_chat(db, "day", oggi)
+
+    def invia_a(cid):
+        tot = per_chat.get(cid, 0)
+        h, m = divmod(tot, 60)
         if tot>0:
             testo = f"⏰ È già passata metà giornata e tu hai studiato {h}h {m}m."
         else:
             testo = "⏰ È già passata metà giornata e non hai ancora studiato! 😱"
-        bot.send_message(chat_id=cid, text=testo)
+        broadcaster.chiama("send_message", cid, text=testo)
+
+    broadcaster.broadcast(registro.chat_attive(), invia_a, "controllo metà giornata")
 
 def ferma(update: Update, context: CallbackContext):
     cid = update.effective_chat.id
-    if cid in CHAT_IDS:
-        CHAT_IDS.remove(cid)
-        salva_chat_ids()
+    if registro.chat_attiva(cid):
+        registro.imposta_chat(cid, False)
+        sincronizza_chat(cid)
         update.message.reply_text(
             "✅ Reminder interrotti.  Usa /riprendi per riattivarli."
         )
@@ -379,81 +359,61 @@ def ferma(update: Update, context: CallbackContext):
 
 def riprendi(update: Update, context: CallbackContext):
     cid = update.effective_chat.id
-    if cid not in CHAT_IDS:
-        CHAT_IDS.add(cid)
-        salva_chat_ids()
+    if not registro.chat_attiva(cid):
+        registro.imposta_chat(cid, True)
+        sincronizza_chat(cid)
         update.message.reply_text("✅ Reminder riattivati.")
     else:
         update.message.reply_text("I reminder erano già attivi.")
 
 def annulla(update: Update, context: CallbackContext):
     cid = update.effective_chat.id
-    if not os.path.exists("sentinel_studio_log.txt"):
-        update.message.reply_text("Nessuna registrazione da annullare.")
-        return
-
-    # leggo tutte le righe e filtro per questa chat
-    with open("sentinel_studio_log.txt", "r", encoding="utf-8") as f:
-        lines = [l for l in f if f"chat_id: {cid}" in l]
-    if not lines:
+    ultime = studio.ultime(cid, 1)
+    if not ultime:
         update.message.reply_text("Nessuna registrazione da annullare.")
         return
 
-    last = lines[-1].strip()
-    pending_annulla[cid] = last
+    pending_annulla[cid] = ultime[-1]
+    last = formatta_voce(ultime[-1])
 
-    kb = [
-        [ InlineKeyboardButton("Sì", callback_data="annulla_si"),
-          InlineKeyboardButton("No", callback_data="annulla_no") ]
-    ]
     update.message.reply_text(
         f"Confermi di cancellare questa registrazione?\n`{last}`",
-        reply_markup=InlineKeyboardMarkup(kb),
+        reply_markup=tastiera("annulla"),
         parse_mode="Markdown"
     )
 
+def esegui_annulla(cid, conferma):
+    """Annulla (se `conferma`) la voce in sospeso della chat; ritorna (testo, parse_mode)."""
+    if cid not in pending_annulla:
+        return "Nessuna operazione in sospeso.", None
+
+    voce = pending_annulla.pop(cid)
+    line_to_remove = formatta_voce(voce)
+
+    if conferma:
+        stato_chat.annulla(voce)
+        return f"🗑️ Registrazione cancellata:\n`{line_to_remove}`", "Markdown"
+    return "❌ Annullamento operazione.", None
+
 def risposta_annulla(update: Update, context: CallbackContext):
     q = update.callback_query
     q.answer()
-    cid = q.message.chat.id
-    data = q.data  # "annulla_si" o "annulla_no"
-
-    if cid not in pending_annulla:
-        q.edit_message_text("Nessuna operazione in sospeso.")
-        return
-
-    line_to_remove = pending_annulla.pop(cid)
-
-    if data == "annulla_si":
-        # rimuovo la prima occorrenza di quella riga
-        with open("sentinel_studio_log.txt", "r", encoding="utf-8") as f:
-            all_lines = f.readlines()
-        with open("sentinel_studio_log.txt", "w", encoding="utf-8") as f:
-            removed = False
-            for l in all_lines:
-                if not removed and l.strip() == line_to_remove:
-                    removed = True
-                    continue
-                f.write(l)
-        q.edit_message_text(f"🗑️ Registrazione cancellata:\n`{line_to_remove}`", parse_mode="Markdown")
-    else:
-        q.edit_message_text("❌ Annullamento operazione.")
+    testo, parse_mode = esegui_annulla(q.message.chat.id, q.data == "annulla_si")
+    q.edit_message_text(testo, parse_mode=parse_mode)
 
 
 def test_settimanale(update: Update, context: CallbackContext):
     logging.info("Ricevuto /test_settimanale, genero grafico settimanale")
     genera_grafico_settimanale()
-    update.message.reply_text(f"✅ Grafico settimanale GENERATO (cartella {REPORT_DIR}/).")
+    update.message.reply_text(
+        f"✅ Grafico settimanale GENERATO (cartella {REPORT_DIR}/, "
+        f"cache: {grafici_settimanali.hit} hit, {grafici_settimanali.miss} miss)."
+    )
 
 def status(update: Update, context: CallbackContext):
     cid = update.effective_chat.id
     oggi = datetime.now().strftime("%Y-%m-%d")
-    tot = 0
-    if os.path.exists("sentinel_studio_log.txt"):
-        with open("sentinel_studio_log.txt","r",encoding="utf-8") as f:
-            for l in f:
-                if oggi in l and f"chat_id: {cid}" in l:
-                    tot += int(l.strip().split(" - ")[2].replace("minuti_studio: ",""))
+    tot = studio.totale(cid, oggi)
     h, m = divmod(tot, 60)
     if tot==0:
         update.message.reply_text("Oggi non hai studiato nulla. 🥲")
@@ -463,20 +423,8 @@ def status(update: Update, context: CallbackContext):
 def attuale(update: Update, context: CallbackContext):
     ora_corr = datetime.now(timezone('Europe/Rome'))
     hhmm = ora_corr.strftime("%H:%M")
-    piano = carica_piano_studio()
-
-    current = None
-    next_ev = None
-
-    for idx, (ora, testo) in enumerate(piano):
-        h, m = map(int, ora.split(":"))
-        ev_time = ora_corr.replace(hour=h, minute=m, second=0, microsecond=0)
-
-        if ora_corr >= ev_time:
-            current = (ora, testo)
-        elif ora_corr < ev_time and next_ev is None:
-            next_ev = (ora, testo)
-            break
+    cid = update.effective_chat.id
+    current, next_ev = blocco_corrente(piani.piano(db.modalita(cid)), ora_corr.hour * 60 + ora_corr.minute)
 
     if current:
         msg = f"Sono le *{hhmm}* — in corso: _{current[1]}_"
@@ -498,58 +446,326 @@ def aggiungi(update: Update, context: CallbackContext):
         update.message.reply_text("Uso: /aggiungi <minuti> — es. /aggiungi 20")
         return
     minuti = int(args[0])
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("sentinel_studio_log.txt","a",encoding="utf-8") as f:
-        f.write(f"{now} - chat_id: {cid} - minuti_studio: {minuti}\n")
+    stato_chat.aggiungi(cid, minuti)
     update.message.reply_text(f"👍 Aggiunti manualmente {minuti} minuti di studio.")
 
 def piano(update: Update, context: CallbackContext):
     """/piano <normale|ridotto|superridotto>"""
     cid = update.effective_chat.id
-    if not context.args or context.args[0] not in ("normale", "ridotto", "superridotto"):
+    if not context.args or context.args[0] not in MODALITA:
         update.message.reply_text(
             "Uso: /piano normale|ridotto|superridotto"
         )
         return
     nuovo = context.args[0]
-    with open("sentinel_piano_corrente.json", "w", encoding="utf-8") as f:
-        json.dump({"modalità": nuovo}, f)
+    db.imposta_modalita(cid, nuovo)
+    sincronizza_chat(cid)
     update.message.reply_text(f"Piano impostato su *{nuovo.upper()}*", parse_mode="Markdown")
 
-# ─── Schedulazioni ──────────────────────────────────────────────────────────────
-scheduler.add_job(genera_grafico_settimanale, 'cron', day_of_week='sun', hour=23, minute=50, timezone='Europe/Rome')
-scheduler.add_job(genera_grafico_giornaliero, 'cron', hour=22, minute=0, timezone='Europe/Rome')
-scheduler.add_job(controllo_meta_giornata,    'cron', hour=12, minute=0, timezone='Europe/Rome')
-scheduler.start()
-
-# ─── Pianifica reminder giornalieri ─────────────────────────────────────────────
-for o,t in carica_piano_studio():
-    h, m = map(int, o.split(":"))
-    scheduler.add_job(manda_reminder, 'cron',
-                      hour=h, minute=m,
-                      timezone='Europe/Rome',
-                      args=[o, t])
-
-# ─── Handler Telegram ──────────────────────────────────────────────────────────
-updater = Updater(TOKEN, use_context=True)
-dp: Dispatcher = updater.dispatcher
-
-dp.add_handler(CommandHandler("start", start))
-dp.add_handler(CommandHandler("status", status))
-dp.add_handler(CommandHandler("attuale", attuale))
-dp.add_handler(CommandHandler("aggiungi", aggiungi))
-dp.add_handler(CommandHandler("test_settimanale", test_settimanale))
-dp.add_handler(CommandHandler("ferma", ferma))
-dp.add_handler(CommandHandler("riprendi", riprendi))
-dp.add_handler(CommandHandler("annulla", annulla))
-dp.add_handler(CommandHandler("piano", piano))
-dp.add_handler(CallbackQueryHandler(risposta_annulla, pattern="^annulla_"))
-dp.add_handler(CallbackQueryHandler(risposta_scoring, pattern="^scoring_"))
-dp.add_handler(CallbackQueryHandler(risposta_adattamento, pattern="^adatta_"))
-
-updater.start_polling()
-try:
-    while True:
-        time.sleep(1)
-except (KeyboardInterrupt, SystemExit):
-    scheduler.shutdown()
+def avvia_scheduler(asincrono=False):
+    """Crea lo scheduler, registra i job fissi e i reminder del piano.
+
+    Con `asincrono` lo scheduler è un AsyncIOScheduler sul loop corrente: i
+    reminder sono coroutine eseguite sul loop, gli altri job (grafici, file,
+    database) girano nel suo pool di thread.
+
+    I reminder di tutte le chat passano da un solo job al minuto, il
+    dispatcher, che legge i destinatari dalla tabella dei reminder.
+    """
+    if asincrono:
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler as Scheduler
+    else:
+        from apscheduler.schedulers.background import BackgroundScheduler as Scheduler
+
+    sched = Scheduler()
+    metriche.collega_scheduler(sched)
+    sched.add_job(genera_grafico_settimanale, 'cron', day_of_week='sun', hour=23, minute=50, timezone='Europe/Rome')
+    sched.add_job(genera_grafico_giornaliero, 'cron', hour=22, minute=0, timezone='Europe/Rome')
+    sched.add_job(controllo_meta_giornata,    'cron', hour=12, minute=0, timezone='Europe/Rome')
+    sched.add_job(compatta_studio,            'cron', hour=4, minute=0, timezone='Europe/Rome')
+    sched.add_job(partizioni.archivia_vecchie, 'cron', day=1, hour=4, minute=30, timezone='Europe/Rome')
+    # controlla se piano o modalità sono cambiati su disco (solo stat dei file)
+    sched.add_job(sincronizza_reminder, 'interval', seconds=PIANO_WATCH_SECONDI, timezone='Europe/Rome')
+    # un solo job per tutte le scadenze dei poll, al passo della ruota
+    sched.add_job(controlla_scadenze_poll, 'interval', seconds=scadenze_poll.tick, timezone='Europe/Rome')
+    # istantanea dello stato per chat, per non rileggere il log al riavvio
+    sched.add_job(stato_chat.salva, 'interval', seconds=STATO_CHAT_SECONDI, timezone='Europe/Rome')
+
+    # ─── Reminder giornalieri ───────────────────────────────────────────────────
+    sincronizza_reminder()
+    sched.add_job(dispatcher_reminder_async if asincrono else dispatcher_reminder, 'cron', second=0,
+                  misfire_grace_time=55, coalesce=True, timezone='Europe/Rome')
+    sched.start()
+    return sched
+
+def sincronizza_reminder():
+    """Allinea la tabella dei reminder a chat attive, modalità e piani su disco.
+
+    I piani sono presi dalla PianoCache (riletti solo se cambia l'mtime):
+    vengono riscritte solo le chat la cui modalità o il cui piano è
+    cambiato, le altre restano come sono.
+    """
+    with reminder_sync_lock:
+        attive = set()
+        cambiate = 0
+        for mod, chat in registro.chat_attive_per_modalita().items():
+            compilato = piani.piano(mod)
+            for cid in chat:
+                attive.add(cid)
+                cambiate += tabella.imposta_chat(cid, mod, compilato)
+        for cid in tabella.chat() - attive:
+            cambiate += tabella.rimuovi_chat(cid)
+    if cambiate:
+        logging.info(f"Reminder sincronizzati coi piani: {cambiate} chat aggiornate, "
+                     f"{tabella.voci()} blocchi in tabella.")
+
+def sincronizza_chat(cid):
+    """Aggiorna in tabella i reminder di una sola chat (attivata, fermata o cambio piano)."""
+    with reminder_sync_lock:
+        if registro.chat_attiva(cid):
+            mod = db.modalita(cid)
+            tabella.imposta_chat(cid, mod, piani.piano(mod))
+        else:
+            tabella.rimuovi_chat(cid)
+
+# ─── Runtime asyncio ────────────────────────────────────────────────────────────
+# Le callback (le più frequenti: arrivano a raffica dopo ogni reminder) e i
+# reminder hanno una versione async che usa la sessione HTTP condivisa;
+# database e file passano dal pool di thread del runtime. I comandi restano
+# sincroni e girano in quel pool.
+
+async def risposta_scoring_async(update, context):
+    q = update.callback_query
+    await client_async.chiama("answerCallbackQuery", callback_query_id=q.id)
+    cid = q.message.chat.id
+    resp = q.data.split("_")[1]  # "si" o "no"
+    await runtime.in_executor(registra_scoring, cid, resp)
+    await client_async.chiama("editMessageText", chat_id=cid, message_id=q.message.message_id,
+                              text=f"Risposta registrata: {resp.upper()}")
+    if serve_adattamento(cid):
+        await client_async.chiama("sendMessage", chat_id=cid, text=TESTO_ADATTAMENTO,
+                                  reply_markup=tastiera("adatta"))
+
+async def risposta_annulla_async(update, context):
+    q = update.callback_query
+    await client_async.chiama("answerCallbackQuery", callback_query_id=q.id)
+    cid = q.message.chat.id
+    testo, parse_mode = await runtime.in_executor(esegui_annulla, cid, q.data == "annulla_si")
+    await client_async.chiama("editMessageText", chat_id=cid, message_id=q.message.message_id,
+                              text=testo, parse_mode=parse_mode)
+
+async def risposta_adattamento_async(update, context):
+    q = update.callback_query
+    await client_async.chiama("answerCallbackQuery", callback_query_id=q.id)
+    cid = q.message.chat.id
+    testo = await runtime.in_executor(applica_adattamento, cid, q.data == "adatta_si")
+    await client_async.chiama("sendMessage", chat_id=cid, text=testo)
+
+async def manda_reminder_async(dovuti):
+    """Come manda_reminder, con un task per chat sul loop."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    testi = {b: testo_reminder(*b) for blocchi in dovuti.values() for b in blocchi}
+
+    async def invia_a(cid):
+        for b in dovuti[cid]:
+            await broadcaster.chiama_async(client_async, "sendMessage", cid, text=testi[b], parse_mode='Markdown')
+            await runtime.in_executor(db.registra_reminder, now, cid, b.testo)
+            if "Studio" in b.testo:
+                poll = await broadcaster.chiama_async(client_async, "sendMessage", cid,
+                                                      text="Stai studiando?", reply_markup=tastiera("scoring"))
+                await runtime.in_executor(registra_poll, cid, poll["message_id"])
+
+    await broadcaster.broadcast_async(dovuti, invia_a, f"reminder {now[11:16]}")
+
+async def dispatcher_reminder_async():
+    dovuti = reminder_dovuti()
+    if dovuti:
+        await manda_reminder_async(dovuti)
+
+# ─── Registrazione handler ──────────────────────────────────────────────────────
+COMANDI = {
+    "start": start,
+    "status": status,
+    "attuale": attuale,
+    "aggiungi": aggiungi,
+    "test_settimanale": test_settimanale,
+    "ferma": ferma,
+    "riprendi": riprendi,
+    "annulla": annulla,
+    "piano": piano,
+}
+# pattern -> (handler sincrono, handler async)
+CALLBACK = {
+    "^annulla_": (risposta_annulla, risposta_annulla_async),
+    "^scoring_": (risposta_scoring, risposta_scoring_async),
+    "^adatta_":  (risposta_adattamento, risposta_adattamento_async),
+}
+
+def registra_handler(dp: Dispatcher):
+    """Collega comandi e callback ai rispettivi handler."""
+    for nome, handler in COMANDI.items():
+        dp.add_handler(CommandHandler(nome, metriche.strumenta_handler("comando", nome, handler)))
+    for pattern, (handler, _) in CALLBACK.items():
+        dp.add_handler(CallbackQueryHandler(
+            metriche.strumenta_handler("callback", handler.__name__, handler), pattern=pattern))
+
+def registra_handler_async(rt):
+    """Come registra_handler, per il RuntimeAsync (callback in versione async)."""
+    for nome, handler in COMANDI.items():
+        rt.comando(nome, metriche.strumenta_handler("comando", nome, handler))
+    for pattern, (_, handler) in CALLBACK.items():
+        rt.callback(pattern, metriche.strumenta_handler("callback", handler.__name__, handler))
+
+def registra_tempo_avvio(t_import, t_pronto):
+    """Logga e accoda su AVVII_LOG i tempi di avvio (ms dall'inizio dell'import)."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    logging.info(f"Avvio completato: import {t_import:.0f} ms, pronto in {t_pronto:.0f} ms.")
+    try:
+        with open(AVVII_LOG, "a", encoding="utf-8") as f:
+            f.write(f"{now} - import_ms: {t_import:.0f} - pronto_ms: {t_pronto:.0f}\n")
+    except Exception as e:
+        logging.error(f"Errore salvataggio tempi di avvio: {e}")
+
+def avvia_webhook(processa, opzioni):
+    """Avvia il server webhook e ritorna (server, segreto); setWebhook lo chiama chi lo avvia."""
+    from utils.webhook import ServerWebhook, carica_segreto
+
+    segreto = carica_segreto(WEBHOOK_SECRET_FILE)
+    server = ServerWebhook(processa, segreto, host=opzioni.host, porta=opzioni.porta)
+    server.avvia()
+    return server, segreto
+
+def avvia_metriche(sched, opzioni):
+    """Endpoint /metrics (--metriche) e dump periodico su file (--metriche-file)."""
+    global server_metriche
+    if opzioni.metriche:
+        server_metriche = metriche.ServerMetriche(host=opzioni.host, porta=opzioni.metriche)
+        server_metriche.avvia()
+    if opzioni.metriche_file:
+        sched.add_job(metriche.scrivi_dump, 'interval', seconds=opzioni.metriche_ogni,
+                      args=[opzioni.metriche_file], name="dump metriche", timezone='Europe/Rome')
+
+def ferma_metriche(opzioni):
+    if server_metriche:
+        server_metriche.ferma()
+    if opzioni.metriche_file:
+        metriche.scrivi_dump(opzioni.metriche_file)
+
+async def main_async(t_import, opzioni):
+    """Runtime asyncio: long polling (o webhook), handler e reminder su un solo loop."""
+    global bot, broadcaster, scheduler, client_async, runtime, webhook
+    from utils.runtime_async import BotSincrono, ClientBotAsync, RuntimeAsync
+
+    client_async = ClientBotAsync(TOKEN)
+    await client_async.apri()
+    bot = BotSincrono(client_async, asyncio.get_running_loop())
+    broadcaster = Broadcaster(bot)
+    runtime = RuntimeAsync(client_async, bot)
+    registra_handler_async(runtime)
+    scheduler = avvia_scheduler(asincrono=True)
+    avvia_metriche(scheduler, opzioni)
+    loop = asyncio.get_running_loop()
+    if opzioni.webhook:
+        webhook, segreto = avvia_webhook(
+            lambda dati: asyncio.run_coroutine_threadsafe(runtime.gestisci(dati), loop).result(), opzioni
+        )
+        if opzioni.webhook_url:
+            await client_async.chiama("setWebhook", url=opzioni.webhook_url, secret_token=segreto,
+                                      allowed_updates=["message", "callback_query"])
+    registra_tempo_avvio(t_import, (time.perf_counter() - _T_AVVIO) * 1000)
+
+    try:
+        if webhook:
+            await asyncio.Event().wait()
+        else:
+            await runtime.polling()
+    finally:
+        if webhook:
+            await loop.run_in_executor(None, webhook.ferma)
+        scheduler.shutdown(wait=False)
+        await runtime.ferma()
+        await asyncio.get_running_loop().run_in_executor(None, broadcaster.shutdown)
+        await client_async.chiudi()
+        await asyncio.get_running_loop().run_in_executor(None, renderer.chiudi)
+        ferma_metriche(opzioni)
+        stato_chat.salva()
+
+def main():
+    global TOKEN, bot, broadcaster, scheduler, updater, webhook
+    t_import = (time.perf_counter() - _T_AVVIO) * 1000
+
+    parser = argparse.ArgumentParser(description="Sentinel: reminder e tracciamento dello studio su Telegram.")
+    parser.add_argument("--runtime", choices=("thread", "asyncio"), default="thread",
+                        help="thread: Updater di python-telegram-bot (default); "
+                             "asyncio: handler async e una sola sessione HTTP (richiede aiohttp)")
+    parser.add_argument("--webhook", action="store_true",
+                        help="riceve gli update su un server HTTP integrato invece del polling")
+    parser.add_argument("--webhook-url", help="URL pubblico da registrare su Telegram con setWebhook")
+    parser.add_argument("--host", default="127.0.0.1", help="indirizzo del server webhook")
+    parser.add_argument("--porta", type=int, default=8443, help="porta del server webhook")
+    parser.add_argument("--metriche", type=int, metavar="PORTA",
+                        help="espone le metriche in formato Prometheus su http://<host>:PORTA/metrics")
+    parser.add_argument("--metriche-file", metavar="FILE", help="scrive periodicamente le metriche su FILE")
+    parser.add_argument("--metriche-ogni", type=int, default=60, metavar="SECONDI",
+                        help="intervallo del dump delle metriche (default 60)")
+    opzioni = parser.parse_args()
+    if opzioni.webhook_url:
+        opzioni.webhook = True
+
+    # ─── Configurazione logging ─────────────────────────────────────────────────
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # ─── Caricamento token & init Bot + Scheduler ──────────────────────────────
+    with open(TOKEN_FILE, "r") as f:
+        TOKEN = f.read().strip()
+    logging.info("Token caricato correttamente.")
+
+    carica_stato()
+    if opzioni.runtime == "asyncio":
+        try:
+            asyncio.run(main_async(t_import, opzioni))
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            registro.chiudi()
+            db.chiudi()
+        return
+
+    # un solo Bot per handler, job e broadcast: ogni richiesta viene misurata.
+    # Il pool copre i 16 worker del Broadcaster più quelli del Dispatcher.
+    bot = Bot(token=TOKEN, request=metriche.RequestStrumentata(con_pool_size=24))
+    broadcaster = Broadcaster(bot)
+    scheduler = avvia_scheduler()
+    avvia_metriche(scheduler, opzioni)
+
+    # ─── Handler Telegram ──────────────────────────────────────────────────────
+    updater = Updater(bot=bot, use_context=True)
+    registra_handler(updater.dispatcher)
+    if opzioni.webhook:
+        dp = updater.dispatcher
+        webhook, segreto = avvia_webhook(lambda dati: dp.process_update(Update.de_json(dati, dp.bot)), opzioni)
+        if opzioni.webhook_url:
+            updater.bot.set_webhook(url=opzioni.webhook_url, secret_token=segreto,
+                                    allowed_updates=["message", "callback_query"])
+    else:
+        updater.start_polling()
+    registra_tempo_avvio(t_import, (time.perf_counter() - _T_AVVIO) * 1000)
+
+    try:
+        while True:
+            time.sleep(1)
+    except (KeyboardInterrupt, SystemExit):
+        if webhook:
+            webhook.ferma()
+        updater.stop()
+        scheduler.shutdown()
+        broadcaster.shutdown()
+        renderer.chiudi()
+        ferma_metriche(opzioni)
+        stato_chat.salva()
+        registro.chiudi()
+        db.chiudi()
+
+
+if __name__ == "__main__":
+    main()
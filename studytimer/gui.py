@@ -22,21 +22,27 @@ class StudyGUI:
         self._update_clock()
 
     def toggle(self) -> None:
-        if not self.is_studying:
-            self.is_studying = True
-            self.tracker.start()
-            self.notifier.send_message("Sto studiando")
-            self.button.config(text="OFF")
+        # the tracker is the source of truth: sensors may start/stop it too
+        if self.tracker.current_start is None:
+            if self.tracker.start():
+                self.notifier.send_message("Sto studiando")
         else:
-            self.is_studying = False
             minutes = self.tracker.stop()
-            self.notifier.send_message(f"Ho studiato {int(minutes)} minuti")
+            if minutes is not None:
+                self.notifier.send_message(f"Ho studiato {int(minutes)} minuti")
+        self._sync()
+
+    def _sync(self) -> None:
+        self.is_studying = self.tracker.current_start is not None
+        self.button.config(text="OFF" if self.is_studying else "ON")
+        if not self.is_studying:
             self.minutes_var.set("0")
-            self.button.config(text="ON")
 
     def _update_clock(self) -> None:
-        if self.is_studying and self.tracker.current_start:
-            elapsed = (datetime.now() - self.tracker.current_start).total_seconds() // 60
+        self._sync()
+        start = self.tracker.current_start
+        if self.is_studying and start:
+            elapsed = (datetime.now() - start).total_seconds() // 60
             self.minutes_var.set(str(int(elapsed)))
         self.root.after(1000, self._update_clock)
 
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+LEVELS = ("hour", "day", "week", "month", "year")
+ALL = 0  # series id for the total across every series (e.g. every chat)
+
+
+def bucket_keys(ts: datetime) -> Dict[str, str]:
+    """Bucket key of ``ts`` at every rollup level.
+
+    Weeks are ISO weeks (Monday to Sunday), written as ``YYYY-Www``.
+    """
+    iso = ts.isocalendar()
+    return {
+        "hour": ts.strftime("%Y-%m-%dT%H"),
+        "day": ts.strftime("%Y-%m-%d"),
+        "week": f"{iso[0]}-W{iso[1]:02d}",
+        "month": ts.strftime("%Y-%m"),
+        "year": ts.strftime("%Y"),
+    }
+
+
+def split_by_hour(start: datetime, end: datetime, minutes: float) -> List[Tuple[datetime, float]]:
+    """Share ``minutes`` among the clock hours between ``start`` and ``end``.
+
+    Each hour gets minutes in proportion to the wall-clock time spent in it,
+    so a session crossing an hour (or midnight) lands in the right buckets.
+    """
+    seconds = (end - start).total_seconds()
+    if seconds <= 0:
+        return [(start, minutes)]
+    parts = []
+    seg_start = start
+    while seg_start < end:
+        next_hour = seg_start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        seg_end = min(next_hour, end)
+        parts.append((seg_start, minutes * (seg_end - seg_start).total_seconds() / seconds))
+        seg_start = seg_end
+    return parts
+
+
+class Rollup:
+    """Minutes pre-aggregated per hour, day, ISO week, month and year.
+
+    Buckets are updated on every write, so a period total is one dictionary
+    lookup. The same bucket keys are used by the desktop tracker (in memory,
+    snapshotted to JSON) and by the Telegram bot (in SQLite).
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[Tuple[str, str, int], float] = {}
+
+    def add(self, ts: datetime, minutes: float, series: int = ALL) -> None:
+        """Add (or, with negative minutes, remove) minutes at ``ts``."""
+        for level, key in bucket_keys(ts).items():
+            self.buckets[(level, key, series)] = self.buckets.get((level, key, series), 0.0) + minutes
+            if series != ALL:
+                self.buckets[(level, key, ALL)] = self.buckets.get((level, key, ALL), 0.0) + minutes
+
+    def add_session(self, start: datetime, end: datetime, minutes: float, series: int = ALL) -> None:
+        for ts, part in split_by_hour(start, end, minutes):
+            self.add(ts, part, series)
+
+    def total(self, level: str, key: str, series: int = ALL) -> float:
+        return self.buckets.get((level, key, series), 0.0)
+
+    # persistence --------------------------------------------------------
+    def to_json(self) -> list:
+        return [[level, key, series, minutes] for (level, key, series), minutes in self.buckets.items()]
+
+    @classmethod
+    def from_json(cls, data: list) -> "Rollup":
+        rollup = cls()
+        rollup.buckets = {(level, key, series): minutes for level, key, series, minutes in data}
+        return rollup
+
+    def save(self, path: str | Path, **extra) -> None:
+        """Atomically write a snapshot (plus any ``extra`` fields) to ``path``."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"buckets": self.to_json(), **extra}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(path)
@@ -0,0 +1,344 @@
+from __future__ import annotations
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from tracker import StudyTracker
+
+try:
+    import paho.mqtt.client as mqtt
+except Exception:  # pragma: no cover - only needed for a real broker
+    mqtt = None  # type: ignore
+
+RING_SIZE = 4096        # readings buffered between two detector passes
+BATCH_INTERVAL = 0.2    # seconds between detector passes
+START_AFTER = 60.0      # seconds the study condition must hold before start()
+STOP_AFTER = 300.0      # seconds it must be false before stop()
+STALE_AFTER = 120.0     # a sensor silent this long counts as inactive
+
+# topic -> sensor name, and the value each sensor needs while studying
+DEFAULT_TOPICS = {
+    "roccamint/desk/presence": "presence",
+    "roccamint/desk/light": "light",
+}
+DEFAULT_THRESHOLDS = {"presence": 1.0, "light": 1.0}
+
+
+class Reading(NamedTuple):
+    ts: float       # epoch seconds
+    sensor: str
+    value: float
+
+
+def parse_payload(payload: bytes) -> Optional[float]:
+    """``b"1"``, ``b"on"``, ``b"23.5"`` or ``b'{"value": 1}'`` -> float (None if unreadable)."""
+    text = payload.decode("utf-8", "replace").strip().lower()
+    if text in ("on", "true", "yes"):
+        return 1.0
+    if text in ("off", "false", "no"):
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        value = json.loads(text).get("value")
+        return float(value) if value is not None else None
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+class RingBuffer:
+    """Fixed-size buffer of readings: when full the oldest are overwritten.
+
+    Memory stays bounded however fast sensors publish; ``dropped`` counts
+    the readings lost because the detector fell behind. ``half_full`` is
+    set when the buffer reaches half its capacity, so the consumer can
+    drain early instead of waiting for its next pass.
+    """
+
+    def __init__(self, capacity: int = RING_SIZE) -> None:
+        self.capacity = capacity
+        self._items: List[Optional[Reading]] = [None] * capacity
+        self._head = 0   # next slot to read
+        self._size = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.half_full = threading.Event()
+
+    def push(self, reading: Reading) -> None:
+        with self._lock:
+            tail = (self._head + self._size) % self.capacity
+            self._items[tail] = reading
+            if self._size == self.capacity:
+                self._head = (self._head + 1) % self.capacity
+                self.dropped += 1
+            else:
+                self._size += 1
+                if self._size == self.capacity // 2:
+                    self.half_full.set()
+
+    def drain(self) -> List[Reading]:
+        """Remove and return every buffered reading, oldest first."""
+        with self._lock:
+            end = self._head + self._size
+            if end <= self.capacity:
+                batch = self._items[self._head:end]
+            else:
+                batch = self._items[self._head:] + self._items[:end - self.capacity]
+            self._head = (self._head + self._size) % self.capacity
+            self._size = 0
+            self.half_full.clear()
+        return batch  # type: ignore[return-value]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class StudyDetector:
+    """Streaming detector that starts and stops tracker sessions.
+
+    Each sensor in ``thresholds`` is active while its latest value is at or
+    above the threshold (and it has reported within ``stale_after``). The
+    user is studying when all of them are active. The condition must hold
+    for ``start_after`` seconds before ``tracker.start()`` and be false for
+    ``stop_after`` seconds before ``tracker.stop()``, so a flickering light
+    or a short break doesn't split the session. Both are backdated to when
+    the condition changed, so the debounce doesn't lengthen the session.
+    State is O(number of sensors): only the latest value of each is kept.
+    """
+
+    def __init__(self, tracker: StudyTracker, thresholds: Dict[str, float],
+                 start_after: float = START_AFTER, stop_after: float = STOP_AFTER,
+                 stale_after: float = STALE_AFTER,
+                 on_start: Callable[[], None] | None = None,
+                 on_stop: Callable[[float], None] | None = None) -> None:
+        self.tracker = tracker
+        self.thresholds = thresholds
+        self.start_after = start_after
+        self.stop_after = stop_after
+        self.stale_after = stale_after
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self._latest: Dict[str, Tuple[float, float]] = {}  # sensor -> (ts, value)
+        self._since: float | None = None  # when the condition last flipped
+        self._condition = False
+        self._armed = True  # False after a manual stop, until the condition clears
+        self._was_studying = False
+        self.started_by_detector = False
+
+    def _active(self, now: float) -> bool:
+        for sensor, threshold in self.thresholds.items():
+            seen = self._latest.get(sensor)
+            if seen is None or now - seen[0] > self.stale_after or seen[1] < threshold:
+                return False
+        return True
+
+    def _due(self, now: float) -> bool:
+        """True if a debounce timer may fire at ``now``."""
+        if self._since is None:
+            return True
+        studying = self.tracker.current_start is not None
+        if self._condition:
+            return not studying and now - self._since >= self.start_after
+        return studying and now - self._since >= self.stop_after
+
+    def feed(self, batch: List[Reading]) -> None:
+        """Apply a batch of readings in order.
+
+        A full evaluation runs only when a reading flips its sensor between
+        active and inactive or a debounce timer is due, plus once at the end
+        of the batch: repeated identical readings cost a dict update each.
+        """
+        thresholds = self.thresholds
+        latest = self._latest
+        for reading in batch:
+            threshold = thresholds.get(reading.sensor)
+            if threshold is None:
+                continue
+            previous = latest.get(reading.sensor)
+            latest[reading.sensor] = (reading.ts, reading.value)
+            flipped = previous is None or (previous[1] >= threshold) != (reading.value >= threshold)
+            if flipped or self._due(reading.ts):
+                self.tick(reading.ts)
+        if batch:
+            self.tick(batch[-1].ts)
+
+    def tick(self, now: float) -> None:
+        """Re-evaluate at ``now`` (also called when no readings arrive)."""
+        condition = self._active(now)
+        if condition != self._condition or self._since is None:
+            self._condition = condition
+            self._since = now
+        held = now - self._since
+        studying = self.tracker.current_start is not None
+        if self._was_studying and not studying:
+            # stopped from the GUI: don't restart while the user is still at the desk
+            self._armed = not condition
+            self.started_by_detector = False
+        elif not condition:
+            self._armed = True
+        self._was_studying = studying
+        if condition and not studying and self._armed and held >= self.start_after:
+            # the session began when the condition did, not when the debounce fired
+            if self.tracker.start(at=datetime.fromtimestamp(self._since)):
+                self.started_by_detector = self._was_studying = True
+                if self.on_start:
+                    self.on_start()
+        elif not condition and studying and self.started_by_detector and held >= self.stop_after:
+            # sessions started from the GUI are left for the GUI to stop
+            minutes = self.tracker.stop(at=datetime.fromtimestamp(self._since))
+            self.started_by_detector = self._was_studying = False
+            if minutes is not None and self.on_stop:
+                self.on_stop(minutes)
+
+
+class SensorIngestor:
+    """Subscribes to sensor topics and feeds the detector in batches.
+
+    The MQTT callback only parses the payload and pushes it into the ring
+    buffer; a worker thread drains the buffer every ``batch_interval``
+    seconds (or as soon as it is half full) and runs the detector on the
+    whole batch. ``client`` is a
+    ``paho.mqtt.client.Client`` (see ``mqtt_client``) or a ``LocalBroker``
+    client; ``topics`` maps MQTT topics to sensor names.
+    """
+
+    def __init__(self, client, detector: StudyDetector, topics: Dict[str, str],
+                 capacity: int = RING_SIZE, batch_interval: float = BATCH_INTERVAL) -> None:
+        self.client = client
+        self.detector = detector
+        self.topics = topics
+        self.buffer = RingBuffer(capacity)
+        self.batch_interval = batch_interval
+        self.received = 0
+        self.rejected = 0   # unknown topic or unreadable payload
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sensor-detector", daemon=True)
+        client.on_message = self._on_message
+        client.on_connect = self._on_connect
+
+    def _on_connect(self, client, *args) -> None:
+        # (re)subscribe on every connect: a clean session forgets subscriptions
+        for topic in self.topics:
+            client.subscribe(topic)
+
+    def _on_message(self, client, userdata, message) -> None:
+        sensor = self.topics.get(message.topic)
+        value = parse_payload(message.payload) if sensor else None
+        if value is None:
+            self.rejected += 1
+            return
+        self.received += 1
+        self.buffer.push(Reading(time.time(), sensor, value))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.buffer.half_full.wait(self.batch_interval)
+            self.process()
+        self.process()
+
+    def process(self) -> int:
+        """Run the detector on everything buffered so far; returns the batch size."""
+        batch = self.buffer.drain()
+        self.detector.feed(batch)
+        self.detector.tick(time.time())
+        return len(batch)
+
+    def start(self) -> None:
+        self._thread.start()
+        self.client.loop_start()
+
+    def stop(self) -> None:
+        self.client.loop_stop()
+        self._stop.set()
+        self.buffer.half_full.set()
+        self._thread.join()
+
+
+def mqtt_client(host: str, port: int = 1883, client_id: str = "studytimer"):
+    """Connected paho client for a real broker."""
+    if mqtt is None:
+        raise RuntimeError("MQTT ingestion requires paho-mqtt (pip install paho-mqtt).")
+    try:
+        # paho-mqtt >= 2.0 requires the callback API version
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    except AttributeError:
+        client = mqtt.Client(client_id=client_id)
+    client.connect(host, port)
+    return client
+
+
+# in-process broker ---------------------------------------------------
+class _Message(NamedTuple):
+    topic: str
+    payload: bytes
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """MQTT topic filter matching with ``+`` and ``#`` wildcards."""
+    parts, levels = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(parts):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(parts) == len(levels)
+
+
+class LocalBroker:
+    """Minimal in-process stand-in for an MQTT broker, for tests and replays.
+
+    ``client()`` returns objects with the subset of the paho client API the
+    ingestor uses; ``publish`` delivers synchronously in the caller's thread.
+    """
+
+    def __init__(self) -> None:
+        self._clients: List[LocalClient] = []
+        self._lock = threading.Lock()
+
+    def client(self) -> "LocalClient":
+        c = LocalClient(self)
+        with self._lock:
+            self._clients.append(c)
+        return c
+
+    def publish(self, topic: str, payload) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif not isinstance(payload, bytes):
+            payload = str(payload).encode("utf-8")
+        message = _Message(topic, payload)
+        with self._lock:
+            clients = list(self._clients)
+        for c in clients:
+            c._deliver(message)
+
+
+class LocalClient:
+    def __init__(self, broker: LocalBroker) -> None:
+        self.broker = broker
+        self.on_message = None
+        self.on_connect = None
+        self._filters: List[str] = []
+        self._running = False
+
+    def subscribe(self, topic: str) -> None:
+        self._filters.append(topic)
+
+    def publish(self, topic: str, payload) -> None:
+        self.broker.publish(topic, payload)
+
+    def loop_start(self) -> None:
+        self._running = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0, None)
+
+    def loop_stop(self) -> None:
+        self._running = False
+
+    def _deliver(self, message: _Message) -> None:
+        if self._running and self.on_message and any(topic_matches(f, message.topic) for f in self._filters):
+            self.on_message(self, None, message)
@@ -1,26 +1,221 @@
 from __future__ import annotations
+import http.client
+import json
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+API_HOST = "api.telegram.org"
+QUEUE_SIZE = 100      # messages waiting for the sender before spilling to the spool
+TIMEOUT = 10          # seconds per HTTP request
+BACKOFF_BASE = 1.0    # first retry delay, doubled after each failure
+BACKOFF_MAX = 300.0   # cap while offline
+
+
+class PermanentError(Exception):
+    """Telegram rejected the message (e.g. bad chat id): retrying won't help."""
 
-try:
-    from telegram import Bot
-except Exception:  # pragma: no cover - telegram might be missing in env
-    Bot = None  # type: ignore
 
 class TelegramNotifier:
-    """Send messages via Telegram bot if configured."""
+    """Send messages via Telegram bot if configured.
 
-    def __init__(self, token: Optional[str] = None, chat_id: Optional[str] = None) -> None:
+    ``send_message`` only enqueues: a background thread delivers messages in
+    order over a single keep-alive HTTPS connection. When a send fails
+    (offline, timeout, 5xx, flood wait) the message is appended to a JSON
+    Lines spool file and retried with exponential backoff; everything queued
+    after it waits behind it, so order is preserved (except for messages
+    spilled straight to the spool when the queue is full). The spool
+    survives restarts and is drained first on the next start. Delivered
+    messages are not removed one by one: a small ``.offset`` file records
+    how far the spool has been delivered, and the spool is deleted once
+    all of it has gone out.
+    """
+
+    def __init__(self, token: Optional[str] = None, chat_id: Optional[str] = None,
+                 spool_file: str | Path = "telegram_spool.jsonl") -> None:
         self.token = token or os.environ.get("TELEGRAM_BOT_TOKEN")
         self.chat_id = chat_id or os.environ.get("TELEGRAM_CHAT_ID")
-        self.bot = Bot(self.token) if self.token and self.chat_id and Bot else None
+        self.enabled = bool(self.token and self.chat_id)
+        self.spool_file = Path(spool_file)
+        self.offset_file = self.spool_file.with_name(self.spool_file.name + ".offset")
+        self._queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._conn: http.client.HTTPSConnection | None = None
+        self._thread: threading.Thread | None = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+            self._thread.start()
 
     def send_message(self, text: str) -> None:
-        if not self.bot:
+        """Queue ``text`` for delivery and return immediately."""
+        if not self.enabled:
             # Fallback to console output when Telegram isn't configured
             print(f"Telegram disabled: {text}")
             return
         try:
-            self.bot.send_message(chat_id=self.chat_id, text=text)
-        except Exception as exc:  # pragma: no cover
-            print(f"Error sending Telegram message: {exc}")
+            self._queue.put_nowait(text)
+        except queue.Full:
+            # the sender is stuck retrying: keep the message on disk instead
+            self._spool_append(text)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the sender, giving queued messages ``timeout`` seconds to go out.
+
+        Whatever is still unsent ends up in the spool for the next run.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)  # wake the sender
+        except queue.Full:
+            pass  # a full queue means the sender is busy and will see _stop soon
+        self._thread.join(max(0.0, deadline - time.monotonic()) + TIMEOUT)
+        while True:
+            try:
+                text = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if text is not None:
+                self._spool_append(text)
+        self._disconnect()
+
+    # spool --------------------------------------------------------------
+    def _spool_offset(self) -> int:
+        """Spool bytes already delivered (0 if unknown or stale)."""
+        try:
+            offset = int(self.offset_file.read_text(encoding="utf-8"))
+            size = self.spool_file.stat().st_size
+        except (OSError, ValueError):
+            return 0
+        return offset if 0 <= offset <= size else 0
+
+    def _spool_load(self) -> List[Tuple[str, int]]:
+        """Undelivered spooled messages as (text, spool offset just past it)."""
+        with self._spool_lock:
+            if not self.spool_file.exists():
+                return []
+            offset = self._spool_offset()
+            items = []
+            with self.spool_file.open("rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn last line after a crash
+                    offset += len(line)
+                    try:
+                        items.append((json.loads(line)["text"], offset))
+                    except (ValueError, KeyError):
+                        continue
+            return items
+
+    def _spool_append(self, text: str) -> int:
+        """Append ``text`` to the spool and return the offset just past it."""
+        line = (json.dumps({"text": text}, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._spool_lock:
+            with self.spool_file.open("a+b") as f:
+                # start on a fresh line if a previous append was cut short
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = b"\n" + line
+                f.write(line)
+                return f.tell()
+
+    def _spool_pop(self, end: int) -> None:
+        """Mark the spool delivered up to ``end``; delete it once fully delivered."""
+        with self._spool_lock:
+            try:
+                size = self.spool_file.stat().st_size
+            except OSError:
+                size = 0
+            if end >= size:
+                self.spool_file.unlink(missing_ok=True)
+                self.offset_file.unlink(missing_ok=True)
+                return
+            tmp = self.offset_file.with_name(self.offset_file.name + ".tmp")
+            tmp.write_text(str(end), encoding="utf-8")
+            os.replace(tmp, self.offset_file)
+
+    # sender thread ------------------------------------------------------
+    def _run(self) -> None:
+        spooled = self._spool_load()
+        delay = BACKOFF_BASE
+        while not self._stop.is_set():
+            if not spooled:
+                # messages spilled by send_message while the queue was full
+                spooled = self._spool_load()
+            if spooled:
+                (text, end), from_spool = spooled[0], True
+            else:
+                text, from_spool = self._queue.get(), False
+                if text is None:
+                    continue
+            try:
+                self._post(text)
+            except PermanentError as exc:
+                print(f"Telegram rejected message, dropped: {exc}")
+            except Exception as exc:
+                if not from_spool:
+                    self._spool_append(text)
+                wait = max(delay, getattr(exc, "retry_after", 0))
+                print(f"Error sending Telegram message ({exc}), retrying in {wait:.0f}s")
+                delay = min(delay * 2, BACKOFF_MAX)
+                self._stop.wait(wait)
+                # while offline, new messages join the spool behind the failed one
+                self._drain_queue_into_spool()
+                # always a prefix of the spool, so delivery offsets only move forward
+                spooled = self._spool_load()
+                continue
+            delay = BACKOFF_BASE
+            if from_spool:
+                spooled.pop(0)
+                self._spool_pop(end)
+
+    def _drain_queue_into_spool(self) -> None:
+        while True:
+            try:
+                text = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if text is None:
+                return
+            self._spool_append(text)
+
+    # HTTP ---------------------------------------------------------------
+    def _post(self, text: str) -> None:
+        body = json.dumps({"chat_id": self.chat_id, "text": text}).encode("utf-8")
+        if self._conn is None:
+            self._conn = http.client.HTTPSConnection(API_HOST, timeout=TIMEOUT)
+        try:
+            self._conn.request("POST", f"/bot{self.token}/sendMessage", body,
+                               {"Content-Type": "application/json"})
+            response = self._conn.getresponse()
+            data = response.read()  # read fully so the connection can be reused
+        except (OSError, http.client.HTTPException):
+            self._disconnect()
+            raise
+        if response.status == 200:
+            return
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            payload = {}
+        description = payload.get("description") or f"HTTP {response.status}"
+        if response.status == 429 or response.status >= 500:
+            exc = RuntimeError(description)
+            exc.retry_after = (payload.get("parameters") or {}).get("retry_after", 0)
+            raise exc
+        raise PermanentError(description)
+
+    def _disconnect(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,85 +1,211 @@
 from __future__ import annotations
 import json
-from datetime import datetime, date, timedelta
+import os
+import threading
+from datetime import datetime, date, time
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, Tuple
+
+from rollup import Rollup, bucket_keys
+
+LEGACY_LOG_FILE = "study_log.json"
+SNAPSHOT_EVERY = 10  # sessions between rollup snapshots
+
 
 class StudyTracker:
-    """Track study sessions and compute time summaries."""
+    """Track study sessions and compute time summaries.
+
+    Sessions are stored in an append-only JSON Lines journal: one record per
+    line, so stopping a session costs a single append regardless of history.
+
+    Totals are served from hour/day/week/month/year rollup buckets that
+    ``stop()`` updates in place, so every report is a single lookup. The
+    buckets are snapshotted next to the journal (``*.rollup.json``) together
+    with the journal offset they cover; on load only the sessions appended
+    after that offset are replayed.
+    """
 
-    def __init__(self, log_file: str | Path = "study_log.json") -> None:
+    def __init__(self, log_file: str | Path = "study_log.jsonl", fsync: bool = True) -> None:
         self.log_file = Path(log_file)
+        self.fsync = fsync
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        self._migrate_legacy_log()
         if not self.log_file.exists():
-            self.log_file.write_text("[]")
+            self.log_file.touch()
+        self.rollup_file = self.log_file.with_name(self.log_file.stem + ".rollup.json")
         self.current_start: datetime | None = None
+        self._session_lock = threading.Lock()  # GUI and sensor detector both start/stop
+        self._rollup_lock = threading.Lock()
+        self._rollup: Rollup | None = None  # loaded on first use
+        self._rollup_offset = 0             # journal bytes covered by the buckets
+        self._unsaved = 0
 
     # session management -------------------------------------------------
-    def start(self) -> None:
-        """Mark the beginning of a study session."""
-        self.current_start = datetime.now()
-
-    def stop(self) -> float:
-        """End current session and return duration in minutes."""
-        if not self.current_start:
-            return 0.0
-        end = datetime.now()
-        minutes = (end - self.current_start).total_seconds() / 60
-        self._append_session(self.current_start, end, minutes)
-        self.current_start = None
-        return minutes
+    def start(self, at: datetime | None = None) -> bool:
+        """Mark the beginning of a study session (now, or at ``at``).
+
+        Returns False, leaving the running session alone, if one was
+        already started.
+        """
+        with self._session_lock:
+            if self.current_start is not None:
+                return False
+            self.current_start = at or datetime.now()
+            return True
+
+    def stop(self, at: datetime | None = None) -> float | None:
+        """End the current session (now, or at ``at``) and return its duration in minutes.
+
+        Returns None if no session was running.
+        """
+        with self._session_lock:
+            start = self.current_start
+            if start is None:
+                return None
+            end = max(at or datetime.now(), start)
+            minutes = (end - start).total_seconds() / 60
+            offset = self._append_session(start, end, minutes)
+            with self._rollup_lock:
+                if offset is None:
+                    self._rollup = None  # journal was repaired: replay on next use
+                elif self._rollup is not None:
+                    self._rollup.add_session(start, end, minutes)
+                    self._rollup_offset = offset
+                    self._unsaved += 1
+                    if self._unsaved >= SNAPSHOT_EVERY:
+                        self._save_rollup()
+            self.current_start = None
+            return minutes
 
     # log handling -------------------------------------------------------
-    def _append_session(self, start: datetime, end: datetime, minutes: float) -> None:
-        data: List[Dict[str, str]] = json.loads(self.log_file.read_text())
-        data.append({
+    def _migrate_legacy_log(self) -> None:
+        """Convert a JSON-array log (the old format) to the journal, once.
+
+        Handles both a legacy array stored at ``log_file`` itself and a
+        ``study_log.json`` sitting next to a journal that doesn't exist yet.
+        The legacy file is kept with a ``.migrated`` suffix.
+        """
+        legacy = self.log_file.with_name(LEGACY_LOG_FILE)
+        if self.log_file.exists():
+            with self.log_file.open("r", encoding="utf-8") as f:
+                head = f.read(64).lstrip()
+            if not head.startswith("["):
+                return
+            legacy = self.log_file
+        elif not legacy.exists():
+            return
+        items = json.loads(legacy.read_text(encoding="utf-8"))
+        tmp = self.log_file.with_name(self.log_file.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        legacy.replace(legacy.with_name(legacy.name + ".migrated"))
+        tmp.replace(self.log_file)
+
+    def _append_session(self, start: datetime, end: datetime, minutes: float) -> int | None:
+        """Append one record and return the journal size after it.
+
+        Returns None when a line cut short by an earlier crash had to be
+        terminated first, since the offsets before this record moved.
+        """
+        record = json.dumps({
             "start": start.isoformat(),
             "end": end.isoformat(),
             "minutes": minutes,
         })
-        self.log_file.write_text(json.dumps(data))
-
-    def _sessions(self) -> List[Dict[str, datetime]]:
-        raw = json.loads(self.log_file.read_text())
-        sessions = []
-        for item in raw:
-            sessions.append({
-                "start": datetime.fromisoformat(item["start"]),
-                "end": datetime.fromisoformat(item["end"]),
-                "minutes": float(item["minutes"]),
-            })
-        return sessions
+        line = (record + "\n").encode("utf-8")
+        with self.log_file.open("a+b") as f:
+            # start on a fresh line if a previous append was cut short
+            repaired = False
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+                    repaired = True
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+            return None if repaired else f.tell()
 
-    # summaries ----------------------------------------------------------
-    def _total_in_range(self, start: date, end: date) -> float:
-        total = 0.0
-        for s in self._sessions():
-            day = s["start"].date()
-            if start <= day < end:
-                total += s["minutes"]
-        return total
+    def _sessions(self, offset: int = 0) -> Iterator[Tuple[Dict[str, datetime], int]]:
+        """Yield (session, journal offset just past it) from ``offset`` on.
+
+        Only complete lines are read, so a record still being appended is
+        left for the next call.
+        """
+        with self.log_file.open("rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # blank line or a record truncated by a crash mid-append
+                    continue
+                yield {
+                    "start": datetime.fromisoformat(item["start"]),
+                    "end": datetime.fromisoformat(item["end"]),
+                    "minutes": float(item["minutes"]),
+                }, offset
+
+    # rollup -----------------------------------------------------------
+    def _load_rollup(self) -> None:
+        """Load the rollup snapshot and replay the journal written after it.
+
+        Without a usable snapshot the buckets are rebuilt from the whole
+        journal; either way the result is saved as a fresh snapshot.
+        """
+        offset = 0
+        rollup = None
+        try:
+            data = json.loads(self.rollup_file.read_text(encoding="utf-8"))
+            if data.get("offset", 0) <= self.log_file.stat().st_size:
+                rollup = Rollup.from_json(data["buckets"])
+                offset = data["offset"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        rollup = rollup or Rollup()
+        replayed = 0
+        for s, end_offset in self._sessions(offset):
+            rollup.add_session(s["start"], s["end"], s["minutes"])
+            offset = end_offset
+            replayed += 1
+        self._rollup, self._rollup_offset = rollup, offset
+        if replayed or not self.rollup_file.exists():
+            self._save_rollup()
 
+    def _save_rollup(self) -> None:
+        self._rollup.save(self.rollup_file, offset=self._rollup_offset)
+        self._unsaved = 0
+
+    def rebuild_rollup(self) -> None:
+        """Recompute every bucket from the raw journal."""
+        with self._rollup_lock:
+            if self.rollup_file.exists():
+                self.rollup_file.unlink()
+            self._load_rollup()
+
+    def _total(self, level: str, day: date | None) -> float:
+        key = bucket_keys(datetime.combine(day or date.today(), time()))[level]
+        with self._rollup_lock:
+            if self._rollup is None:
+                self._load_rollup()
+            return self._rollup.total(level, key)
+
+    # summaries ----------------------------------------------------------
     def daily_total(self, day: date | None = None) -> float:
-        day = day or date.today()
-        return self._total_in_range(day, day + timedelta(days=1))
+        return self._total("day", day)
 
     def weekly_total(self, day: date | None = None) -> float:
-        day = day or date.today()
-        start = day - timedelta(days=day.weekday())
-        end = start + timedelta(days=7)
-        return self._total_in_range(start, end)
+        return self._total("week", day)
 
     def monthly_total(self, day: date | None = None) -> float:
-        day = day or date.today()
-        start = day.replace(day=1)
-        if start.month == 12:
-            end = start.replace(year=start.year + 1, month=1)
-        else:
-            end = start.replace(month=start.month + 1)
-        return self._total_in_range(start, end)
+        return self._total("month", day)
 
     def yearly_total(self, day: date | None = None) -> float:
-        day = day or date.today()
-        start = date(day.year, 1, 1)
-        end = date(day.year + 1, 1, 1)
-        return self._total_in_range(start, end)
+        return self._total("year", day)
@@ -0,0 +1,279 @@
+"""Invio concorrente a molte chat con rate limit e retry sui flood-wait."""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metriche import IO_SECONDI, TELEGRAM_RETRY, conta_broadcast
+
+try:
+    from telegram.error import BadRequest, NetworkError
+except Exception:  # pragma: no cover - telegram potrebbe mancare (es. bot finto)
+    BadRequest = NetworkError = None  # type: ignore
+
+# limiti documentati da Telegram: ~30 messaggi/s in totale, ~1/s per chat
+GLOBAL_RATE    = 30.0
+PER_CHAT_RATE  = 1.0
+PER_CHAT_BURST = 3
+
+# frammenti (minuscoli) dei BadRequest di Telegram che riguardano il file_id
+# stesso e non la chat destinataria
+ERRORI_FILE_ID = ("wrong file identifier", "wrong remote file identifier", "file reference",
+                  "wrong type of the web page content", "file_id")
+
+EsitoBroadcast = namedtuple("EsitoBroadcast", ["nome", "totale", "inviati", "falliti", "durata"])
+
+
+def file_id_rifiutato(e: Exception) -> bool:
+    """True se l'errore dice che Telegram non riconosce più il file_id."""
+    if BadRequest is None or not isinstance(e, BadRequest):
+        return False
+    testo = str(e).lower()
+    return any(f in testo for f in ERRORI_FILE_ID)
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` gettoni al secondo, al massimo `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _prendi(self) -> float:
+        """Prende un gettone se c'è; altrimenti ritorna i secondi da attendere."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Blocca finché non è disponibile un gettone."""
+        while True:
+            attesa = self._prendi()
+            if attesa <= 0:
+                return
+            time.sleep(attesa)
+
+    async def acquire_async(self) -> None:
+        """Come acquire(), ma attende senza bloccare il loop asyncio."""
+        while True:
+            attesa = self._prendi()
+            if attesa <= 0:
+                return
+            await asyncio.sleep(attesa)
+
+
+class FileIdCache:
+    """Cache persistente file -> file_id Telegram delle foto già caricate.
+
+    Ogni voce ricorda l'hash del contenuto: se il file viene rigenerato con
+    dati diversi il file_id non vale più; se i bytes sono gli stessi (es. un
+    /test_settimanale ripetuto) si riusa senza ricaricare nulla.
+    """
+
+    def __init__(self, path: str = "file_ids.json") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._dati = {}  # file -> {"sha256": ..., "file_id": ...}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._dati = json.load(f)
+            except Exception as e:
+                logging.warning(f"Cache file_id illeggibile ({e}), riparto vuoto.")
+
+    def get(self, file: str, sha256: str):
+        with self._lock:
+            voce = self._dati.get(file)
+        if voce and voce.get("sha256") == sha256:
+            return voce.get("file_id")
+        return None
+
+    def put(self, file: str, sha256: str, file_id: str) -> None:
+        with self._lock:
+            self._dati[file] = {"sha256": sha256, "file_id": file_id}
+            self._salva()
+
+    def scarta(self, *file: str) -> None:
+        """Dimentica i file_id di questi file (es. PNG cancellati dalla cache dei grafici)."""
+        with self._lock:
+            tolti = [f for f in file if self._dati.pop(f, None) is not None]
+            if tolti:
+                self._salva()
+
+    def _salva(self) -> None:
+        tmp = self.path + ".tmp"
+        with IO_SECONDI.cronometra("file_ids"):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._dati, f)
+            os.replace(tmp, self.path)
+
+
+class Broadcaster:
+    """Esegue invii verso più chat in parallelo.
+
+    Ogni chiamata alla Bot API passa da `chiama`, che applica il token bucket
+    globale e quello della singola chat e ripete la richiesta con backoff su
+    429 (RetryAfter) ed errori di rete transitori. Funziona con qualunque
+    oggetto che esponga i metodi del Bot usati (anche un bot finto locale).
+    """
+
+    def __init__(self, bot, workers: int = 16, global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, per_chat_burst: int = PER_CHAT_BURST,
+                 max_tentativi: int = 5, backoff: float = 1.0) -> None:
+        self.bot = bot
+        self.max_tentativi = max_tentativi
+        self.backoff = backoff
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._globale = TokenBucket(global_rate, global_rate)
+        self._per_chat = {}  # chat_id -> TokenBucket
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="broadcast")
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        with self._lock:
+            b = self._per_chat.get(chat_id)
+            if b is None:
+                b = self._per_chat[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            return b
+
+    def chiama(self, metodo: str, chat_id, **kwargs):
+        """Invoca `bot.<metodo>(chat_id=..., **kwargs)` sotto rate limit, con retry."""
+        bucket = self._bucket(chat_id)
+        for tentativo in range(1, self.max_tentativi + 1):
+            bucket.acquire()
+            self._globale.acquire()
+            try:
+                return getattr(self.bot, metodo)(chat_id=chat_id, **kwargs)
+            except Exception as e:
+                attesa = getattr(e, "retry_after", None)
+                if attesa is None:
+                    transitorio = (NetworkError is not None and isinstance(e, NetworkError)
+                                   and not isinstance(e, BadRequest))
+                    if not transitorio:
+                        raise
+                    attesa = self.backoff * 2 ** (tentativo - 1)
+                if tentativo == self.max_tentativi:
+                    raise
+                logging.warning(f"{metodo} a {chat_id} fallito ({e}), ritento tra {attesa}s.")
+                TELEGRAM_RETRY.incrementa(metodo)
+                time.sleep(float(attesa))
+
+    def _fan_out(self, chat_ids, invia_a, nome: str, falliti: dict) -> None:
+        futures = {cid: self._pool.submit(invia_a, cid) for cid in chat_ids}
+        for cid, fut in futures.items():
+            try:
+                fut.result()
+            except Exception as e:
+                falliti[cid] = e
+                logging.error(f"Errore {nome} verso {cid}: {e}")
+
+    @staticmethod
+    def _esito(nome: str, totale: int, falliti: dict, t0: float) -> EsitoBroadcast:
+        durata = time.monotonic() - t0
+        esito = EsitoBroadcast(nome, totale, totale - len(falliti), falliti, durata)
+        logging.info(f"Broadcast {nome}: {esito.inviati}/{esito.totale} chat in {durata:.2f}s.")
+        conta_broadcast(nome, esito.inviati, len(falliti))
+        return esito
+
+    def broadcast(self, chat_ids, invia_a, nome: str = "broadcast") -> EsitoBroadcast:
+        """Chiama `invia_a(chat_id)` per ogni chat in parallelo e attende la fine.
+
+        Un errore su una chat viene registrato e non blocca le altre.
+        """
+        chat_ids = list(chat_ids)
+        t0 = time.monotonic()
+        falliti = {}
+        self._fan_out(chat_ids, invia_a, nome, falliti)
+        return self._esito(nome, len(chat_ids), falliti, t0)
+
+    def broadcast_foto(self, chat_ids, file: str, cache: FileIdCache = None,
+                       nome: str = "foto", **kwargs) -> EsitoBroadcast:
+        """Invia la stessa foto a tutte le chat caricandola al più una volta.
+
+        Se la cache ha un file_id valido per questo contenuto lo si usa
+        subito; altrimenti la foto viene caricata verso una chat alla volta
+        finché un invio riesce, e il file_id restituito da Telegram serve
+        tutte le altre chat in parallelo (e viene salvato in cache).
+        """
+        chat_ids = list(chat_ids)
+        totale = len(chat_ids)
+        t0 = time.monotonic()
+        falliti = {}
+        with open(file, "rb") as img:
+            foto = img.read()
+        sha = hashlib.sha256(foto).hexdigest()
+        file_id = cache.get(file, sha) if cache else None
+        if file_id is not None and chat_ids:
+            # provo il file_id in cache sulla prima chat: se Telegram non lo
+            # riconosce più lo scarto e ricarico la foto; gli altri errori
+            # (chat inesistente, bot bloccato...) riguardano solo quella chat
+            cid = chat_ids[0]
+            try:
+                self.chiama("send_photo", cid, photo=file_id, **kwargs)
+                chat_ids.pop(0)
+            except Exception as e:
+                if file_id_rifiutato(e):
+                    logging.warning(f"file_id in cache per {file} rifiutato ({e}), ricarico.")
+                    cache.scarta(file)
+                    file_id = None
+                else:
+                    falliti[chat_ids.pop(0)] = e
+                    logging.error(f"Errore {nome} verso {cid}: {e}")
+        while chat_ids and file_id is None:
+            cid = chat_ids.pop(0)
+            try:
+                msg = self.chiama("send_photo", cid, photo=foto, **kwargs)
+            except Exception as e:
+                falliti[cid] = e
+                logging.error(f"Errore {nome} verso {cid}: {e}")
+                continue
+            file_id = msg.photo[-1].file_id
+            if cache:
+                cache.put(file, sha, file_id)
+        if chat_ids:
+            self._fan_out(
+                chat_ids,
+                lambda cid: self.chiama("send_photo", cid, photo=file_id, **kwargs),
+                nome, falliti
+            )
+        return self._esito(nome, totale, falliti, t0)
+
+    # ─── Runtime asyncio ──────────────────────────────────────────────────────
+    async def chiama_async(self, client, metodo: str, chat_id, **kwargs):
+        """Come `chiama`, ma con un ClientBotAsync (metodo API, es. "sendMessage").
+
+        I token bucket sono gli stessi degli invii dai thread, quindi i limiti
+        di Telegram valgono per tutto il processo; i retry li fa il client.
+        """
+        await self._bucket(chat_id).acquire_async()
+        await self._globale.acquire_async()
+        return await client.chiama(metodo, chat_id=chat_id, **kwargs)
+
+    async def broadcast_async(self, chat_ids, invia_a, nome: str = "broadcast") -> EsitoBroadcast:
+        """Esegue la coroutine `invia_a(chat_id)` per ogni chat, tutte insieme sul loop."""
+        chat_ids = list(chat_ids)
+        t0 = time.monotonic()
+        falliti = {}
+        esiti = await asyncio.gather(*(invia_a(cid) for cid in chat_ids), return_exceptions=True)
+        for cid, esito in zip(chat_ids, esiti):
+            if isinstance(esito, Exception):
+                falliti[cid] = esito
+                logging.error(f"Errore {nome} verso {cid}: {esito}")
+        return self._esito(nome, len(chat_ids), falliti, t0)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,88 @@
+"""Cache dei grafici PNG indicizzata sull'hash dei dati disegnati."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from utils.metriche import METRICHE
+
+MAX_FILE   = 120  # PNG tenuti per cartella
+MAX_GIORNI = 60   # PNG più vecchi di così vengono cancellati
+
+CACHE_GRAFICI = METRICHE.contatore(
+    "sentinel_cache_grafici_totale", "Richieste di grafici servite dalla cache (hit) o disegnate (miss).",
+    ("grafico", "esito"))
+
+
+def chiave(tipo: str, data: str, serie) -> str:
+    """Hash di tipo di grafico, data e serie aggregata (qualunque valore JSON)."""
+    testo = json.dumps([tipo, data, serie], separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(testo.encode("utf-8")).hexdigest()[:16]
+
+
+class CacheGrafici:
+    """PNG già disegnati in una cartella, ritrovati dall'hash dei loro dati.
+
+    Il file si chiama `<tipo>_<data>_<hash>.png`: se esiste, gli stessi dati
+    sono già stati disegnati e matplotlib non viene nemmeno importato. Dopo
+    ogni nuovo disegno la cartella viene potata: via i PNG più vecchi di
+    `max_giorni` e, oltre `max_file`, i meno recenti. Un hit aggiorna
+    l'mtime del file, quindi l'età conta dall'ultimo uso. `rimossi`, se
+    dato, riceve i percorsi cancellati (es. FileIdCache.scarta).
+    """
+
+    def __init__(self, cartella: str, max_file: int = MAX_FILE, max_giorni: float = MAX_GIORNI,
+                 rimossi=None) -> None:
+        self.cartella = cartella
+        self.max_file = max_file
+        self.max_giorni = max_giorni
+        self.rimossi = rimossi
+        self.hit = 0
+        self.miss = 0
+        self._lock = threading.Lock()
+        os.makedirs(cartella, exist_ok=True)
+
+    def percorso(self, tipo: str, data: str, serie) -> str:
+        return os.path.join(self.cartella, f"{tipo}_{data}_{chiave(tipo, data, serie)}.png")
+
+    def ottieni(self, tipo: str, data: str, serie, disegna) -> str:
+        """Percorso del PNG per questi dati; se manca lo crea con `disegna(percorso)`."""
+        path = self.percorso(tipo, data, serie)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self.hit += 1
+                CACHE_GRAFICI.incrementa(tipo, "hit")
+                logging.info(f"Grafico {tipo} dalla cache: {path}")
+                return path
+            self.miss += 1
+            CACHE_GRAFICI.incrementa(tipo, "miss")
+            tmp = path[:-len(".png")] + ".tmp.png"
+            disegna(tmp)
+            os.replace(tmp, path)
+            self.pota()
+        return path
+
+    def pota(self) -> int:
+        """Cancella i PNG scaduti o in eccesso; ritorna quanti ne ha tolti."""
+        limite = time.time() - self.max_giorni * 86400
+        file = []
+        for voce in os.scandir(self.cartella):
+            if voce.is_file() and voce.name.endswith(".png") and not voce.name.endswith(".tmp.png"):
+                file.append((voce.stat().st_mtime, voce.path))
+        file.sort(reverse=True)
+        via = []
+        for i, (mtime, p) in enumerate(file):
+            if mtime < limite or i >= self.max_file:
+                try:
+                    os.remove(p)
+                    via.append(p)
+                except OSError as e:
+                    logging.warning(f"Impossibile cancellare {p}: {e}")
+        if via:
+            logging.info(f"Cache grafici {self.cartella}: {len(via)} PNG rimossi.")
+            if self.rimossi:
+                self.rimossi(*via)
+        return len(via)
@@ -0,0 +1,186 @@
+"""Archivio SQLite (WAL) con tutto lo stato di sentinel.py."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from utils.metriche import IO_SECONDI
+from utils.studio_store import parse_riga
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    chiave TEXT PRIMARY KEY,
+    valore TEXT
+);
+CREATE TABLE IF NOT EXISTS chat (
+    chat_id INTEGER PRIMARY KEY,
+    attiva  INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS piano_chat (
+    chat_id  INTEGER PRIMARY KEY,
+    modalita TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS misses (
+    chat_id   INTEGER PRIMARY KEY,
+    conteggio INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS eventi_studio (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      TEXT    NOT NULL,
+    giorno  TEXT    NOT NULL,
+    chat_id INTEGER NOT NULL,
+    minuti  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eventi_chat_giorno ON eventi_studio (chat_id, giorno, id);
+CREATE INDEX IF NOT EXISTS eventi_chat ON eventi_studio (chat_id, id);
+CREATE INDEX IF NOT EXISTS eventi_giorno ON eventi_studio (giorno, id);
+CREATE TABLE IF NOT EXISTS tombstone (
+    evento_id INTEGER PRIMARY KEY,
+    ts        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reminder_log (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts        TEXT    NOT NULL,
+    chat_id   INTEGER NOT NULL,
+    messaggio TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reminder_chat_ts ON reminder_log (chat_id, ts);
+CREATE INDEX IF NOT EXISTS reminder_ts ON reminder_log (ts);
+CREATE TABLE IF NOT EXISTS rollup (
+    livello TEXT    NOT NULL,    -- "hour", "day", "week", "month", "year"
+    chiave  TEXT    NOT NULL,    -- es. "2025-08-19T09", "2025-W34"
+    chat_id INTEGER NOT NULL,    -- 0 = tutte le chat
+    minuti  INTEGER NOT NULL,
+    PRIMARY KEY (livello, chiave, chat_id)
+);
+CREATE TABLE IF NOT EXISTS partizioni (
+    mese          TEXT PRIMARY KEY,  -- "YYYY-MM"
+    stato         TEXT NOT NULL,     -- "live" o "archiviata"
+    eventi        INTEGER NOT NULL DEFAULT 0,
+    reminder      INTEGER NOT NULL DEFAULT 0,
+    archiviata_il TEXT
+);
+"""
+
+
+class SentinelDB:
+    """Connessione unica, condivisa tra i thread e protetta da un lock.
+
+    Il database è in WAL mode: le letture non bloccano le scritture e ogni
+    handler si riduce a una query su un indice.
+    """
+
+    def __init__(self, path: str = "sentinel.db") -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # ─── Primitive ────────────────────────────────────────────────────────────
+    def query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def query_uno(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def esegui(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    @contextmanager
+    def transazione(self):
+        """Blocco di scritture atomico (BEGIN IMMEDIATE ... COMMIT)."""
+        with self._lock, IO_SECONDI.cronometra("db_transazione"):
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def chiudi(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ─── Modalità del piano (per chat) ────────────────────────────────────────
+    def modalita(self, chat_id: int) -> str:
+        r = self.query_uno("SELECT modalita FROM piano_chat WHERE chat_id = ?", (chat_id,))
+        return r[0] if r else "normale"
+
+    def imposta_modalita(self, chat_id: int, modalita: str) -> None:
+        self.esegui(
+            "INSERT INTO piano_chat (chat_id, modalita) VALUES (?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET modalita = excluded.modalita",
+            (chat_id, modalita)
+        )
+
+    # ─── Audit dei reminder ───────────────────────────────────────────────────
+    def registra_reminder(self, ts: str, chat_id: int, messaggio: str) -> None:
+        self.esegui(
+            "INSERT INTO reminder_log (ts, chat_id, messaggio) VALUES (?, ?, ?)",
+            (ts, chat_id, messaggio)
+        )
+
+    # ─── Migrazione dai vecchi file ───────────────────────────────────────────
+    def importa_file_legacy(self, chat_ids_file: str, misses_file: str, stato_file: str,
+                            studio_log: str, reminder_log: str) -> None:
+        """Importa una sola volta i vecchi file di stato; poi li rinomina in *.migrato.
+
+        La modalità globale del vecchio file di stato diventa la modalità di
+        tutte le chat importate.
+        """
+        if self.query_uno("SELECT valore FROM meta WHERE chiave = 'import_legacy'"):
+            return
+        with self.transazione() as c:
+            chat_ids = []
+            if os.path.exists(chat_ids_file):
+                with open(chat_ids_file, "r", encoding="utf-8") as f:
+                    chat_ids = [int(cid) for cid in json.load(f)]
+                c.executemany("INSERT OR IGNORE INTO chat (chat_id, attiva) VALUES (?, 1)",
+                              [(cid,) for cid in chat_ids])
+            if os.path.exists(stato_file):
+                try:
+                    with open(stato_file, "r", encoding="utf-8") as f:
+                        modalita = json.load(f).get("modalità", "normale")
+                except Exception as e:
+                    logging.warning(f"Stato piano corrotto ({e}), uso 'normale'.")
+                    modalita = "normale"
+                c.executemany("INSERT OR IGNORE INTO piano_chat (chat_id, modalita) VALUES (?, ?)",
+                              [(cid, modalita) for cid in chat_ids])
+            if os.path.exists(misses_file):
+                with open(misses_file, "r", encoding="utf-8") as f:
+                    dati = json.load(f)
+                c.executemany("INSERT OR REPLACE INTO misses (chat_id, conteggio) VALUES (?, ?)",
+                              [(int(k), int(v)) for k, v in dati.items()])
+            n_studio = 0
+            if os.path.exists(studio_log):
+                with open(studio_log, "r", encoding="utf-8") as f:
+                    voci = (parse_riga(l) for l in f)
+                    righe = [(v.ts, v.ts[:10], v.chat_id, v.minuti) for v in voci if v]
+                c.executemany(
+                    "INSERT INTO eventi_studio (ts, giorno, chat_id, minuti) VALUES (?, ?, ?, ?)", righe
+                )
+                n_studio = len(righe)
+            n_reminder = 0
+            if os.path.exists(reminder_log):
+                righe = []
+                with open(reminder_log, "r", encoding="utf-8") as f:
+                    for l in f:
+                        # "YYYY-MM-DD HH:MM:SS - chat_id: xxx - reminder: testo"
+                        parti = l.rstrip("\n").split(" - ", 2)
+                        if len(parti) == 3 and parti[1].startswith("chat_id: "):
+                            righe.append((parti[0], int(parti[1][9:]), parti[2].replace("reminder: ", "", 1)))
+                c.executemany("INSERT INTO reminder_log (ts, chat_id, messaggio) VALUES (?, ?, ?)", righe)
+                n_reminder = len(righe)
+            c.execute("INSERT INTO meta (chiave, valore) VALUES ('import_legacy', datetime('now'))")
+        for path in (chat_ids_file, misses_file, stato_file, studio_log, reminder_log):
+            if os.path.exists(path):
+                os.replace(path, path + ".migrato")
+        logging.info(f"Importati i vecchi file: {n_studio} voci di studio, {n_reminder} reminder.")
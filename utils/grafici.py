@@ -0,0 +1,89 @@
+"""Rendering dei grafici con l'API a oggetti di matplotlib, su un thread dedicato."""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metriche import METRICHE
+
+COMPRESSIONE_PNG = 1   # zlib veloce: Telegram ricomprime comunque le foto
+
+RENDER_SECONDI = METRICHE.istogramma(
+    "sentinel_grafico_render_secondi", "Durata del rendering di un grafico (dati -> PNG).", ("grafico",))
+
+
+class _Modello:
+    """Figura, assi e linea costruiti una volta; a ogni rendering cambiano solo i dati."""
+
+    def __init__(self, figsize, x, etichette_x, xlabel, ylabel, titolo="") -> None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.figura = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figura)
+        self.assi = self.figura.add_subplot()
+        (self.linea,) = self.assi.plot(x, [0] * len(x), marker="o", linestyle="-")
+        self.assi.set_xticks(x)
+        if etichette_x is not None:
+            self.assi.set_xticklabels(etichette_x)
+        self.assi.set_xlabel(xlabel)
+        self.assi.set_ylabel(ylabel)
+        self.assi.set_title(titolo)
+        self.assi.grid(alpha=0.3)
+        # margini fissi: niente tight_layout (un draw in più) a ogni rendering
+        self.figura.subplots_adjust(left=0.08, right=0.98, top=0.93, bottom=0.1)
+
+    def salva(self, path: str, valori, titolo: str = None) -> None:
+        self.linea.set_ydata(valori)
+        if titolo is not None:
+            self.assi.set_title(titolo)
+        self.assi.relim()
+        self.assi.autoscale_view()
+        self.figura.savefig(path, format="png", pil_kwargs={"compress_level": COMPRESSIONE_PNG})
+
+
+class RendererGrafici:
+    """Disegna i grafici giornaliero e settimanale su un unico thread.
+
+    matplotlib non è thread-safe: figure e assi vivono solo nel thread
+    "grafici" e i chiamanti (job dello scheduler) ricevono il PNG finito.
+    I due modelli sono costruiti al primo uso e riusati, quindi font, assi
+    e tick non si ricalcolano da zero. Ogni rendering registra la durata
+    nelle metriche. La memoria la misura il benchmark: tracemalloc è di
+    tutto il processo e rallenterebbe anche gli altri thread.
+    """
+
+    def __init__(self, giorni) -> None:
+        self.giorni = list(giorni)
+        self._modelli = {}
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="grafici")
+
+    def _modello(self, nome: str) -> _Modello:
+        modello = self._modelli.get(nome)
+        if modello is None:
+            if nome == "settimanale":
+                modello = _Modello((10, 6), list(range(7)), self.giorni, "Giorno della settimana",
+                                   "Ore di studio", "Andamento settimanale studio (ultimi 7 giorni)")
+            else:
+                modello = _Modello((10, 5), list(range(24)), None, "Ora del giorno", "Minuti di studio")
+            self._modelli[nome] = modello
+        return modello
+
+    def _disegna(self, nome: str, path: str, valori, titolo) -> None:
+        t0 = time.perf_counter()
+        self._modello(nome).salva(path, valori, titolo)
+        durata = time.perf_counter() - t0
+        RENDER_SECONDI.osserva(durata, nome)
+        logging.info(f"Grafico {nome} disegnato in {durata * 1000:.0f} ms.")
+
+    def settimanale(self, path: str, minuti_per_giorno) -> None:
+        """PNG con le ore di studio per giorno della settimana (minuti in ingresso)."""
+        ore = [m / 60 for m in minuti_per_giorno]
+        self._pool.submit(self._disegna, "settimanale", path, ore, None).result()
+
+    def giornaliero(self, path: str, giorno: str, minuti_per_ora) -> None:
+        """PNG con i minuti di studio per ciascuna ora del giorno."""
+        titolo = f"Studio oggi ({giorno}) per fasce orarie"
+        self._pool.submit(self._disegna, "giornaliero", path, list(minuti_per_ora), titolo).result()
+
+    def chiudi(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,284 @@
+"""Metriche in memoria (contatori e istogrammi) esposte in formato testo Prometheus."""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from telegram.utils.request import Request
+except Exception:  # pragma: no cover - telegram potrebbe mancare (es. benchmark)
+    Request = object  # type: ignore
+
+# secondi: dai lookup in memoria ai broadcast e ai grafici
+BUCKET_SECONDI = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(valore) -> str:
+    return str(valore).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etichette(nomi, valori, extra: str = "") -> str:
+    coppie = [f'{n}="{_escape(v)}"' for n, v in zip(nomi, valori)]
+    if extra:
+        coppie.append(extra)
+    return "{" + ",".join(coppie) + "}" if coppie else ""
+
+
+class Contatore:
+    """Contatore monotono, una serie per combinazione di etichette."""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, aiuto: str, etichette=()) -> None:
+        self.nome = nome
+        self.aiuto = aiuto
+        self.etichette = tuple(etichette)
+        self._lock = threading.Lock()
+        self._valori = {}
+
+    def incrementa(self, *etichette, valore: float = 1) -> None:
+        with self._lock:
+            self._valori[etichette] = self._valori.get(etichette, 0) + valore
+
+    def valore(self, *etichette) -> float:
+        with self._lock:
+            return self._valori.get(etichette, 0)
+
+    def righe(self) -> list:
+        with self._lock:
+            valori = sorted(self._valori.items())
+        return [f"{self.nome}{_etichette(self.etichette, k)} {v}" for k, v in valori]
+
+
+class Istogramma:
+    """Istogramma a bucket cumulativi (come quelli di Prometheus)."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, aiuto: str, etichette=(), bucket=BUCKET_SECONDI) -> None:
+        self.nome = nome
+        self.aiuto = aiuto
+        self.etichette = tuple(etichette)
+        self.bucket = tuple(bucket)
+        self._lock = threading.Lock()
+        self._serie = {}  # etichette -> [conteggi per bucket..., somma, totale]
+
+    def osserva(self, valore: float, *etichette) -> None:
+        with self._lock:
+            s = self._serie.get(etichette)
+            if s is None:
+                s = self._serie[etichette] = [0] * len(self.bucket) + [0.0, 0]
+            for i, limite in enumerate(self.bucket):
+                if valore <= limite:
+                    s[i] += 1
+            s[-2] += valore
+            s[-1] += 1
+
+    @contextmanager
+    def cronometra(self, *etichette):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.osserva(time.perf_counter() - t0, *etichette)
+
+    def conteggio(self, *etichette) -> int:
+        with self._lock:
+            s = self._serie.get(etichette)
+            return s[-1] if s else 0
+
+    def righe(self) -> list:
+        with self._lock:
+            serie = sorted((k, list(s)) for k, s in self._serie.items())
+        righe = []
+        for k, s in serie:
+            for limite, n in zip(self.bucket, s):
+                le = _etichette(self.etichette, k, 'le="%s"' % limite)
+                righe.append(f"{self.nome}_bucket{le} {n}")
+            le = _etichette(self.etichette, k, 'le="+Inf"')
+            righe.append(f"{self.nome}_bucket{le} {s[-1]}")
+            righe.append(f"{self.nome}_sum{_etichette(self.etichette, k)} {s[-2]}")
+            righe.append(f"{self.nome}_count{_etichette(self.etichette, k)} {s[-1]}")
+        return righe
+
+
+class Registro:
+    """Tutte le metriche del processo, serializzabili in formato testo Prometheus."""
+
+    def __init__(self) -> None:
+        self._metriche = []
+
+    def contatore(self, nome: str, aiuto: str, etichette=()) -> Contatore:
+        m = Contatore(nome, aiuto, etichette)
+        self._metriche.append(m)
+        return m
+
+    def istogramma(self, nome: str, aiuto: str, etichette=(), bucket=BUCKET_SECONDI) -> Istogramma:
+        m = Istogramma(nome, aiuto, etichette, bucket)
+        self._metriche.append(m)
+        return m
+
+    def testo(self) -> str:
+        righe = []
+        for m in self._metriche:
+            righe.append(f"# HELP {m.nome} {m.aiuto}")
+            righe.append(f"# TYPE {m.nome} {m.tipo}")
+            righe.extend(m.righe())
+        return "\n".join(righe) + "\n"
+
+
+METRICHE = Registro()
+
+# ─── Metriche del bot ───────────────────────────────────────────────────────────
+HANDLER_SECONDI = METRICHE.istogramma(
+    "sentinel_handler_secondi", "Durata degli handler di comandi e callback.", ("tipo", "handler"))
+HANDLER_ERRORI = METRICHE.contatore(
+    "sentinel_handler_errori_totale", "Handler terminati con un'eccezione.", ("tipo", "handler"))
+JOB_RITARDO = METRICHE.istogramma(
+    "sentinel_job_ritardo_secondi", "Ritardo tra orario previsto e avvio effettivo dei job.", ("job",))
+JOB_MANCATI = METRICHE.contatore(
+    "sentinel_job_mancati_totale", "Esecuzioni dei job saltate (misfire).", ("job",))
+JOB_ERRORI = METRICHE.contatore(
+    "sentinel_job_errori_totale", "Job terminati con un'eccezione.", ("job",))
+TELEGRAM_SECONDI = METRICHE.istogramma(
+    "sentinel_telegram_richiesta_secondi", "Durata delle richieste alla Bot API.", ("metodo",))
+TELEGRAM_ERRORI = METRICHE.contatore(
+    "sentinel_telegram_errori_totale", "Richieste alla Bot API fallite, per tipo di errore.", ("metodo", "errore"))
+TELEGRAM_RETRY = METRICHE.contatore(
+    "sentinel_telegram_retry_totale", "Richieste ripetute dopo flood wait o errori di rete.", ("metodo",))
+BROADCAST_INVII = METRICHE.contatore(
+    "sentinel_broadcast_invii_totale", "Invii dei broadcast per esito.", ("broadcast", "esito"))
+IO_SECONDI = METRICHE.istogramma(
+    "sentinel_io_secondi", "Durata delle operazioni su file e database.", ("operazione",))
+
+
+def _nome_broadcast(nome: str) -> str:
+    # "reminder normale 08:30" -> "reminder": niente etichette ad alta cardinalità
+    return nome.split(" ", 1)[0]
+
+
+def conta_broadcast(nome: str, inviati: int, falliti: int) -> None:
+    BROADCAST_INVII.incrementa(_nome_broadcast(nome), "ok", valore=inviati)
+    if falliti:
+        BROADCAST_INVII.incrementa(_nome_broadcast(nome), "errore", valore=falliti)
+
+
+# ─── Strumentazione ─────────────────────────────────────────────────────────────
+def strumenta_handler(tipo: str, nome: str, handler):
+    """Avvolge un handler (sincrono o async) misurandone durata ed errori."""
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def avvolto(update, context):
+            t0 = time.perf_counter()
+            try:
+                return await handler(update, context)
+            except Exception:
+                HANDLER_ERRORI.incrementa(tipo, nome)
+                raise
+            finally:
+                HANDLER_SECONDI.osserva(time.perf_counter() - t0, tipo, nome)
+        return avvolto
+
+    @functools.wraps(handler)
+    def avvolto(update, context):
+        t0 = time.perf_counter()
+        try:
+            return handler(update, context)
+        except Exception:
+            HANDLER_ERRORI.incrementa(tipo, nome)
+            raise
+        finally:
+            HANDLER_SECONDI.osserva(time.perf_counter() - t0, tipo, nome)
+    return avvolto
+
+
+class RequestStrumentata(Request):
+    """`telegram.utils.request.Request` che misura ogni chiamata alla Bot API.
+
+    Il metodo è l'ultima parte dell'URL (sendMessage, sendPhoto, ...); gli
+    errori sono contati con il nome della classe dell'eccezione di PTB.
+    """
+
+    def post(self, url, data, timeout=None):
+        metodo = url.rsplit("/", 1)[-1]
+        t0 = time.perf_counter()
+        try:
+            return super().post(url, data, timeout=timeout)
+        except Exception as e:
+            TELEGRAM_ERRORI.incrementa(metodo, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDI.osserva(time.perf_counter() - t0, metodo)
+
+
+def collega_scheduler(sched) -> None:
+    """Registra ritardo, misfire ed errori dei job di uno scheduler APScheduler."""
+    from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+
+    def nome_job(job_id):
+        job = sched.get_job(job_id)
+        return job.name if job is not None else job_id
+
+    def ascolta(evento):
+        nome = nome_job(evento.job_id)
+        if evento.code == EVENT_JOB_SUBMITTED:
+            adesso = time.time()
+            for previsto in evento.scheduled_run_times:
+                JOB_RITARDO.osserva(max(0.0, adesso - previsto.timestamp()), nome)
+        elif evento.code == EVENT_JOB_MISSED:
+            JOB_MANCATI.incrementa(nome)
+        elif evento.code == EVENT_JOB_ERROR:
+            JOB_ERRORI.incrementa(nome)
+
+    sched.add_listener(ascolta, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_ERROR)
+
+
+# ─── Esposizione ────────────────────────────────────────────────────────────────
+class ServerMetriche:
+    """Endpoint HTTP locale: GET /metrics ritorna il testo Prometheus."""
+
+    def __init__(self, registro: Registro = METRICHE, host: str = "127.0.0.1", porta: int = 9108) -> None:
+        testo = registro.testo
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                corpo = testo().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, porta), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def indirizzo(self):
+        return self._server.server_address
+
+    def avvia(self) -> None:
+        threading.Thread(target=self._server.serve_forever, name="metriche-http", daemon=True).start()
+        host, porta = self.indirizzo[:2]
+        logging.info(f"Metriche su http://{host}:{porta}/metrics")
+
+    def ferma(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def scrivi_dump(path: str, registro: Registro = METRICHE) -> None:
+    """Scrive (in modo atomico) il testo delle metriche su file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registro.testo())
+    os.replace(tmp, path)
@@ -0,0 +1,160 @@
+"""Partizioni mensili del log di studio e dei reminder, con archiviazione."""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from utils.metriche import IO_SECONDI
+from utils.studio_store import VIVA
+
+MESI_LIVE = 3
+
+
+def _mese_successivo(mese: str) -> str:
+    anno, m = map(int, mese.split("-"))
+    return f"{anno + 1}-01" if m == 12 else f"{anno}-{m + 1:02d}"
+
+
+def _mese_precedente(mese: str, n: int) -> str:
+    anno, m = map(int, mese.split("-"))
+    totale = anno * 12 + (m - 1) - n
+    return f"{totale // 12}-{totale % 12 + 1:02d}"
+
+
+def _unisci(archiviati, campi: tuple, live: list, escludi=()) -> list:
+    """Righe già archiviate (dict) più quelle live, una per id e in ordine di id."""
+    righe = {r["id"]: tuple(r[k] for k in campi) for r in archiviati if r["id"] not in escludi}
+    righe.update((r[0], tuple(r)) for r in live)
+    return [righe[i] for i in sorted(righe)]
+
+
+class Partizioni:
+    """Log partizionati per mese, con un piccolo manifest nella tabella `partizioni`.
+
+    I mesi recenti restano "live" nel database, dove le query lavorano solo
+    sui giorni richiesti tramite l'indice su `giorno`. I mesi più vecchi di
+    `mesi_live` vengono esportati in file JSON Lines compressi dentro
+    `cartella` (uno per mese e per tipo) e tolti dalle tabelle live; il
+    manifest ricorda quali mesi sono dove, così nessuna query sui giorni
+    recenti paga per la storia accumulata.
+    """
+
+    def __init__(self, db, cartella: str = "archivio", mesi_live: int = MESI_LIVE) -> None:
+        self.db = db
+        self.cartella = cartella
+        self.mesi_live = mesi_live
+
+    def _file(self, tipo: str, mese: str) -> str:
+        return os.path.join(self.cartella, f"{tipo}_{mese}.jsonl.gz")
+
+    # ─── Manifest ─────────────────────────────────────────────────────────────
+    def aggiorna_manifest(self) -> None:
+        """Ricalcola i conteggi dei mesi live (tabelle lette tramite indice)."""
+        eventi = dict(self.db.query(
+            "SELECT substr(giorno, 1, 7), COUNT(*) FROM eventi_studio GROUP BY 1"
+        ))
+        reminder = dict(self.db.query(
+            "SELECT substr(ts, 1, 7), COUNT(*) FROM reminder_log GROUP BY 1"
+        ))
+        with self.db.transazione() as c:
+            for mese in eventi.keys() | reminder.keys():
+                c.execute(
+                    "INSERT INTO partizioni (mese, stato, eventi, reminder) VALUES (?, 'live', ?, ?) "
+                    "ON CONFLICT(mese) DO UPDATE SET eventi = excluded.eventi, reminder = excluded.reminder "
+                    "WHERE stato = 'live'",
+                    (mese, eventi.get(mese, 0), reminder.get(mese, 0))
+                )
+
+    def manifest(self) -> list:
+        """Righe (mese, stato, eventi, reminder, archiviata_il) in ordine di mese."""
+        return self.db.query(
+            "SELECT mese, stato, eventi, reminder, archiviata_il FROM partizioni ORDER BY mese"
+        )
+
+    # ─── Archiviazione ────────────────────────────────────────────────────────
+    def archivia_vecchie(self, oggi: date = None) -> list:
+        """Archivia tutti i mesi live più vecchi degli ultimi `mesi_live`. Ritorna i mesi archiviati."""
+        oggi = oggi or date.today()
+        limite = _mese_precedente(oggi.strftime("%Y-%m"), self.mesi_live - 1)
+        self.aggiorna_manifest()
+        mesi = [r[0] for r in self.db.query(
+            "SELECT mese FROM partizioni WHERE stato = 'live' AND mese < ? ORDER BY mese", (limite,)
+        )]
+        for mese in mesi:
+            self.archivia(mese)
+        return mesi
+
+    def archivia(self, mese: str) -> None:
+        """Esporta un mese su file compressi e lo rimuove dalle tabelle live.
+
+        I file vengono scritti e sincronizzati su disco prima di cancellare le
+        righe; le voci annullate (tombstone) non vengono archiviate.
+        """
+        os.makedirs(self.cartella, exist_ok=True)
+        inizio, fine = f"{mese}-01", f"{_mese_successivo(mese)}-01"
+        eventi = self.db.query(
+            "SELECT id, ts, chat_id, minuti FROM eventi_studio "
+            f"WHERE giorno >= ? AND giorno < ? AND {VIVA} ORDER BY id", (inizio, fine)
+        )
+        reminder = self.db.query(
+            "SELECT id, ts, chat_id, messaggio FROM reminder_log WHERE ts >= ? AND ts < ? ORDER BY id",
+            (inizio, fine)
+        )
+        campi_eventi = ("id", "ts", "chat_id", "minuti")
+        campi_reminder = ("id", "ts", "chat_id", "messaggio")
+        # se il mese era già stato archiviato (o un crash è arrivato tra la
+        # scrittura dei file e il DELETE) le righe si uniscono per id, senza doppioni
+        annullate = {r[0] for r in self.db.query(
+            "SELECT t.evento_id FROM tombstone t JOIN eventi_studio e ON e.id = t.evento_id "
+            "WHERE e.giorno >= ? AND e.giorno < ?", (inizio, fine)
+        )}
+        eventi = _unisci(self.leggi_archivio("eventi_studio", mese), campi_eventi, eventi, annullate)
+        reminder = _unisci(self.leggi_archivio("reminder_log", mese), campi_reminder, reminder)
+        self._scrivi(self._file("eventi_studio", mese), campi_eventi, eventi)
+        self._scrivi(self._file("reminder_log", mese), campi_reminder, reminder)
+        with self.db.transazione() as c:
+            c.execute(
+                "DELETE FROM tombstone WHERE evento_id IN "
+                "(SELECT id FROM eventi_studio WHERE giorno >= ? AND giorno < ?)", (inizio, fine)
+            )
+            c.execute("DELETE FROM eventi_studio WHERE giorno >= ? AND giorno < ?", (inizio, fine))
+            c.execute("DELETE FROM reminder_log WHERE ts >= ? AND ts < ?", (inizio, fine))
+            c.execute(
+                "INSERT INTO partizioni (mese, stato, eventi, reminder, archiviata_il) "
+                "VALUES (?, 'archiviata', ?, ?, ?) ON CONFLICT(mese) DO UPDATE SET "
+                "stato = 'archiviata', eventi = excluded.eventi, reminder = excluded.reminder, "
+                "archiviata_il = excluded.archiviata_il",
+                (mese, len(eventi), len(reminder), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+        logging.info(f"Partizione {mese} archiviata: {len(eventi)} voci di studio, {len(reminder)} reminder.")
+
+    @staticmethod
+    def _scrivi(path: str, campi: tuple, righe: list) -> None:
+        tmp = path + ".tmp"
+        with IO_SECONDI.cronometra("archivio"), gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for r in righe:
+                f.write(json.dumps(dict(zip(campi, r)), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # ─── Lettura ──────────────────────────────────────────────────────────────
+    def leggi_archivio(self, tipo: str, mese: str):
+        """Itera i record (dict) di un mese archiviato; `tipo` è "eventi_studio" o "reminder_log"."""
+        path = self._file(tipo, mese)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def voci_archiviate(self):
+        """Itera le voci di studio di tutti i mesi archiviati (per ricostruire i rollup)."""
+        for mese in self.mesi_archiviati():
+            yield from self.leggi_archivio("eventi_studio", mese)
+
+    def mesi_archiviati(self) -> list:
+        return [r[0] for r in self.db.query(
+            "SELECT mese FROM partizioni WHERE stato = 'archiviata' ORDER BY mese"
+        )]
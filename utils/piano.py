@@ -0,0 +1,114 @@
+"""Cache dei piani di studio, compilati per lookup con bisect."""
+import json
+import logging
+import os
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+
+STATO_FILE = "sentinel_piano_corrente.json"  # vecchia modalità globale, solo per la migrazione
+MODALITA   = ("normale", "ridotto", "superridotto")
+
+# un piano pronto all'uso: blocchi ordinati per orario, minuti dalla
+# mezzanotte di ciascun blocco, testo "prossimo blocco" già composto e
+# indice orario "HH:MM" -> posizione
+PianoCompilato = namedtuple("PianoCompilato", ["blocchi", "minuti", "prossimo", "indice"])
+
+PIANO_VUOTO = PianoCompilato([], [], [], {})
+
+
+def minuti_del_giorno(orario: str) -> int:
+    """ "HH:MM" -> minuti dalla mezzanotte."""
+    h, m = map(int, orario.split(":"))
+    return h * 60 + m
+
+
+def file_piano(modalità: str) -> str:
+    nome_file = f"piano_{modalità}.json"
+    if not os.path.exists(nome_file):
+        nome_file = "piano_normale.json"
+    return nome_file
+
+
+def leggi_blocchi(nome_file: str) -> list:
+    """Ritorna la lista di (orario, testo) contenuta in un file di piano."""
+    try:
+        with open(nome_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logging.error(f"Errore caricamento {nome_file}: {e}")
+        return []
+    raw = data.get("blocchi") if isinstance(data, dict) else data if isinstance(data, list) else []
+    piano = []
+    for entry in raw:
+        if isinstance(entry, list) and len(entry) == 2:
+            piano.append((entry[0], entry[1]))
+        elif isinstance(entry, dict):
+            o = entry.get("ora"); t = entry.get("testo")
+            if o and t:
+                piano.append((o, t))
+    return piano
+
+
+def compila(blocchi: list) -> PianoCompilato:
+    """Ordina i blocchi per orario e precalcola tutto ciò che serve ai lookup."""
+    validi = []
+    for o, t in blocchi:
+        try:
+            validi.append((minuti_del_giorno(o), o, t))
+        except ValueError:
+            logging.warning(f"Orario non valido nel piano: {o!r}, blocco ignorato.")
+    validi.sort(key=lambda b: b[0])
+    ordinati = [(o, t) for _, o, t in validi]
+    prossimo = []
+    for i in range(len(ordinati)):
+        if i + 1 < len(ordinati):
+            po, pt = ordinati[i + 1]
+            prossimo.append(f"⏳ Hai tempo fino alle *{po}*, poi *{pt}*.")
+        else:
+            prossimo.append(None)
+    indice = {}
+    for i, (o, _) in enumerate(ordinati):
+        indice.setdefault(o, i)
+    return PianoCompilato(ordinati, [m for m, _, _ in validi], prossimo, indice)
+
+
+def blocco_corrente(piano: PianoCompilato, minuti: int):
+    """Ritorna (corrente, prossimo) per un orario in minuti; None se assente."""
+    i = bisect_right(piano.minuti, minuti)
+    corrente = piano.blocchi[i - 1] if i > 0 else None
+    prossimo = piano.blocchi[i] if i < len(piano.blocchi) else None
+    return corrente, prossimo
+
+
+class PianoCache:
+    """Piani compilati in memoria, ricaricati solo quando cambia l'mtime.
+
+    I file piano_<modalità>.json sono riletti da disco solo se il loro mtime
+    è cambiato dall'ultima lettura; la modalità di ogni chat sta nel database.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._piani = {}  # nome_file -> (mtime, PianoCompilato)
+
+    @staticmethod
+    def _mtime(path: str):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def piano(self, modalità: str = "normale") -> PianoCompilato:
+        """Piano compilato per una modalità."""
+        nome_file = file_piano(modalità)
+        mtime = self._mtime(nome_file)
+        with self._lock:
+            cached = self._piani.get(nome_file)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            compilato = compila(leggi_blocchi(nome_file)) if mtime is not None else PIANO_VUOTO
+            if mtime is None:
+                logging.error(f"Errore caricamento {nome_file}: file mancante")
+            self._piani[nome_file] = (mtime, compilato)
+            return compilato
@@ -0,0 +1,107 @@
+"""Rollup per ora, giorno, settimana ISO, mese e anno delle registrazioni di studio."""
+import logging
+from datetime import datetime
+
+from studytimer.rollup import ALL, bucket_keys
+
+FORMATO_TS = "%Y-%m-%d %H:%M:%S"
+
+# Le chiavi dei bucket sono le stesse del tracker desktop (studytimer.rollup):
+#   hour "2025-08-19T09", day "2025-08-19", week "2025-W34",
+#   month "2025-08", year "2025".
+# Ogni bucket esiste per la singola chat e per il totale di tutte (chat_id = ALL).
+
+
+def aggiorna(c, ts: str, chat_id: int, minuti: int) -> None:
+    """Somma `minuti` (anche negativi) ai bucket della voce, dentro la transazione `c`."""
+    chiavi = bucket_keys(datetime.strptime(ts, FORMATO_TS))
+    c.executemany(
+        "INSERT INTO rollup (livello, chiave, chat_id, minuti) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(livello, chiave, chat_id) DO UPDATE SET minuti = minuti + excluded.minuti",
+        [(livello, chiave, serie, minuti) for livello, chiave in chiavi.items() for serie in (chat_id, ALL)]
+    )
+
+
+def totale(db, livello: str, chiave: str, chat_id: int = ALL) -> int:
+    """Minuti di un bucket (0 se vuoto)."""
+    r = db.query_uno(
+        "SELECT minuti FROM rollup WHERE livello = ? AND chiave = ? AND chat_id = ?",
+        (livello, chiave, chat_id)
+    )
+    return r[0] if r else 0
+
+
+def intervallo(db, livello: str, da: str, a: str, chat_id: int = ALL) -> dict:
+    """chiave -> minuti dei bucket di un livello con da <= chiave <= a."""
+    return dict(db.query(
+        "SELECT chiave, minuti FROM rollup "
+        "WHERE livello = ? AND chat_id = ? AND chiave >= ? AND chiave <= ?",
+        (livello, chat_id, da, a)
+    ))
+
+
+def per_chat(db, livello: str, chiave: str) -> dict:
+    """chat_id -> minuti di un bucket, per tutte le chat."""
+    return dict(db.query(
+        "SELECT chat_id, minuti FROM rollup WHERE livello = ? AND chiave = ? AND chat_id != ?",
+        (livello, chiave, ALL)
+    ))
+
+
+# chiave di ogni livello calcolata in SQL da una voce (ts "YYYY-MM-DD HH:MM:SS")
+_CHIAVI_SQL = {
+    "hour": "substr(ts, 1, 10) || 'T' || substr(ts, 12, 2)",
+    "day": "giorno",
+    "month": "substr(giorno, 1, 7)",
+    "year": "substr(giorno, 1, 4)",
+}
+
+
+def ricostruisci(db, archivio=()) -> int:
+    """Ricalcola da zero tutti i bucket dalle voci grezze.
+
+    Le voci live non annullate e i record dei mesi archiviati (`archivio`:
+    dict con ts, chat_id, minuti) finiscono in una tabella temporanea;
+    ore, giorni, mesi e anni si sommano con un GROUP BY ciascuno, le
+    settimane ISO dai bucket giornalieri e i totali di tutte le chat dai
+    bucket per chat. Ritorna il numero di bucket scritti.
+    """
+    from utils.studio_store import VIVA
+    with db.transazione() as c:
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS voci_rollup "
+                  "(ts TEXT, giorno TEXT, chat_id INTEGER, minuti INTEGER)")
+        c.execute("DELETE FROM voci_rollup")
+        c.execute(f"INSERT INTO voci_rollup SELECT ts, giorno, chat_id, minuti FROM eventi_studio WHERE {VIVA}")
+        c.executemany("INSERT INTO voci_rollup VALUES (?, ?, ?, ?)",
+                      ((r["ts"], r["ts"][:10], r["chat_id"], r["minuti"]) for r in archivio))
+        c.execute("DELETE FROM rollup")
+        for livello, chiave in _CHIAVI_SQL.items():
+            c.execute(
+                "INSERT INTO rollup (livello, chiave, chat_id, minuti) "
+                f"SELECT ?, {chiave}, chat_id, SUM(minuti) FROM voci_rollup GROUP BY 2, 3", (livello,)
+            )
+        settimana_di = {}
+        settimane = {}
+        for giorno, cid, minuti in c.execute("SELECT chiave, chat_id, minuti FROM rollup WHERE livello = 'day'"):
+            if giorno not in settimana_di:
+                settimana_di[giorno] = bucket_keys(datetime.strptime(giorno, "%Y-%m-%d"))["week"]
+            k = (settimana_di[giorno], cid)
+            settimane[k] = settimane.get(k, 0) + minuti
+        c.executemany("INSERT INTO rollup (livello, chiave, chat_id, minuti) VALUES ('week', ?, ?, ?)",
+                      [(sett, cid, minuti) for (sett, cid), minuti in settimane.items()])
+        c.execute(
+            "INSERT INTO rollup (livello, chiave, chat_id, minuti) "
+            "SELECT livello, chiave, ?, SUM(minuti) FROM rollup GROUP BY livello, chiave", (ALL,)
+        )
+        c.execute("DROP TABLE voci_rollup")
+        c.execute("INSERT OR REPLACE INTO meta (chiave, valore) VALUES ('rollup', datetime('now'))")
+        n = c.execute("SELECT COUNT(*) FROM rollup").fetchone()[0]
+    logging.info(f"Rollup ricostruiti: {n} bucket.")
+    return n
+
+
+def assicura(db, archivio=()) -> None:
+    """Ricostruisce i rollup se non sono mai stati calcolati su questo database."""
+    if not db.query_uno("SELECT valore FROM meta WHERE chiave = 'rollup'"):
+        ricostruisci(db, archivio)
+
@@ -0,0 +1,277 @@
+"""Runtime asyncio: Bot API su una sola sessione HTTP e dispatch degli update."""
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from utils.metriche import TELEGRAM_ERRORI, TELEGRAM_RETRY, TELEGRAM_SECONDI
+
+try:
+    import aiohttp
+except Exception:  # pragma: no cover - dipendenza opzionale, solo per questo runtime
+    aiohttp = None
+
+try:
+    from telegram import Message, Update
+    from telegram.error import BadRequest, NetworkError, RetryAfter
+except Exception:  # pragma: no cover
+    Message = Update = BadRequest = NetworkError = RetryAfter = None  # type: ignore
+
+API_URL = "https://api.telegram.org/bot{token}/{metodo}"
+CONNESSIONI = 100         # connessioni contemporanee verso la Bot API
+UPDATE_IN_VOLO = 1000     # update in lavorazione prima di smettere di leggerne altri
+POLL_TIMEOUT = 50         # secondi di long polling per getUpdates
+
+
+class ErroreApi(Exception):
+    """Risposta `ok: false` della Bot API."""
+
+    def __init__(self, metodo: str, descrizione: str, codice: int = None, retry_after: float = None) -> None:
+        super().__init__(f"{metodo}: {descrizione}")
+        self.metodo = metodo
+        self.codice = codice
+        self.retry_after = retry_after
+
+
+def _serializza(valore):
+    """Oggetti telegram (tastiere, ecc.) -> dict pronti per il JSON."""
+    return valore.to_dict() if hasattr(valore, "to_dict") else valore
+
+
+def _camel(nome: str) -> str:
+    """send_message -> sendMessage"""
+    testa, *resto = nome.split("_")
+    return testa + "".join(p.capitalize() for p in resto)
+
+
+class ClientBotAsync:
+    """Client Bot API asincrono con una sola `aiohttp.ClientSession`.
+
+    Tutte le chiamate in uscita (risposte, broadcast, long polling) passano
+    dallo stesso pool di connessioni keep-alive, limitato a `connessioni`.
+    Sulle risposte 429 si attende il `retry_after` indicato da Telegram; gli
+    errori di rete vengono ritentati con backoff esponenziale.
+    """
+
+    def __init__(self, token: str, connessioni: int = CONNESSIONI,
+                 max_tentativi: int = 5, backoff: float = 1.0) -> None:
+        if aiohttp is None:
+            raise RuntimeError("Il runtime asyncio richiede aiohttp (pip install aiohttp).")
+        self.token = token
+        self.connessioni = connessioni
+        self.max_tentativi = max_tentativi
+        self.backoff = backoff
+        self._session = None
+
+    async def apri(self) -> None:
+        # la sessione va creata dentro il loop che la userà
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connessioni),
+            timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 30),
+        )
+
+    async def chiudi(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    @staticmethod
+    def _corpo(params: dict) -> dict:
+        file = [k for k, v in params.items() if isinstance(v, (bytes, bytearray))]
+        if not file:
+            return {"json": {k: _serializza(v) for k, v in params.items()}}
+        form = aiohttp.FormData()
+        for k, v in params.items():
+            if k in file:
+                form.add_field(k, bytes(v), filename=k)
+            elif isinstance(v, str):
+                form.add_field(k, v)
+            else:
+                form.add_field(k, json.dumps(_serializza(v)))
+        return {"data": form}
+
+    async def chiama(self, metodo: str, **params):
+        """Invoca un metodo della Bot API (es. "sendMessage") e ritorna `result`."""
+        params = {k: v for k, v in params.items() if v is not None}
+        url = API_URL.format(token=self.token, metodo=metodo)
+        for tentativo in range(1, self.max_tentativi + 1):
+            t0 = time.perf_counter()
+            try:
+                async with self._session.post(url, **self._corpo(params)) as r:
+                    dati = await r.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                TELEGRAM_SECONDI.osserva(time.perf_counter() - t0, metodo)
+                TELEGRAM_ERRORI.incrementa(metodo, type(e).__name__)
+                if tentativo == self.max_tentativi:
+                    raise
+                attesa = self.backoff * 2 ** (tentativo - 1)
+                logging.warning(f"{metodo} fallito ({e}), ritento tra {attesa}s.")
+                TELEGRAM_RETRY.incrementa(metodo)
+                await asyncio.sleep(attesa)
+                continue
+            TELEGRAM_SECONDI.osserva(time.perf_counter() - t0, metodo)
+            if dati.get("ok"):
+                return dati.get("result")
+            retry_after = (dati.get("parameters") or {}).get("retry_after")
+            TELEGRAM_ERRORI.incrementa(metodo, "RetryAfter" if retry_after else f"http_{dati.get('error_code')}")
+            if retry_after and tentativo < self.max_tentativi:
+                logging.warning(f"{metodo}: flood wait, ritento tra {retry_after}s.")
+                TELEGRAM_RETRY.incrementa(metodo)
+                await asyncio.sleep(retry_after)
+                continue
+            raise ErroreApi(metodo, dati.get("description"), dati.get("error_code"), retry_after)
+
+
+class BotSincrono:
+    """Facciata sincrona del client, con i metodi del `telegram.Bot` usati dal bot.
+
+    Serve al codice che gira nei thread (handler sincroni, job dei grafici,
+    Broadcaster): `bot.send_message(chat_id=..., ...)` diventa una
+    `sendMessage` eseguita sul loop, sulla stessa sessione HTTP. Gli errori
+    tornano come eccezioni di python-telegram-bot, così retry e gestione dei
+    file_id non cambiano. Non va chiamata dal thread del loop.
+    """
+
+    defaults = None  # letto dagli oggetti telegram (es. Message.reply_text)
+
+    def __init__(self, client: ClientBotAsync, loop: asyncio.AbstractEventLoop) -> None:
+        # va costruita dentro il loop (es. in una coroutine)
+        self.client = client
+        self.loop = loop
+        self._thread_loop = threading.get_ident()
+
+    def __getattr__(self, nome: str):
+        if nome.startswith("_"):
+            raise AttributeError(nome)
+        metodo = _camel(nome)
+
+        def chiamata(**kwargs):
+            kwargs.pop("timeout", None)
+            kwargs.update(kwargs.pop("api_kwargs", None) or {})
+            return self._esegui(metodo, kwargs)
+        return chiamata
+
+    def _esegui(self, metodo: str, params: dict):
+        if threading.get_ident() == self._thread_loop:
+            raise RuntimeError(f"{metodo} sincrono chiamato dal thread del loop asyncio")
+        try:
+            risultato = asyncio.run_coroutine_threadsafe(
+                self.client.chiama(metodo, **params), self.loop
+            ).result()
+        except ErroreApi as e:
+            if e.retry_after and RetryAfter is not None:
+                raise RetryAfter(e.retry_after) from e
+            if e.codice == 400 and BadRequest is not None:
+                raise BadRequest(str(e)) from e
+            raise
+        except Exception as e:
+            if aiohttp is not None and isinstance(e, aiohttp.ClientError) and NetworkError is not None:
+                raise NetworkError(str(e)) from e
+            raise
+        if isinstance(risultato, dict) and "message_id" in risultato and Message is not None:
+            return Message.de_json(risultato, self)
+        return risultato
+
+
+class RuntimeAsync:
+    """Legge gli update con long polling e li smista agli handler.
+
+    Gli handler sono registrati come in python-telegram-bot (comando o
+    pattern della callback). Quelli `async def` girano direttamente sul
+    loop; quelli sincroni in un pool di thread dedicato, con la facciata
+    `BotSincrono` dentro gli Update. Al più `in_volo` update sono in
+    lavorazione insieme: oltre quella soglia il polling si ferma finché
+    qualcuno non finisce.
+    """
+
+    def __init__(self, client: ClientBotAsync, bot: BotSincrono, workers: int = 8,
+                 in_volo: int = UPDATE_IN_VOLO) -> None:
+        self.client = client
+        self.bot = bot
+        self._comandi = {}
+        self._callback = []  # (regex, handler)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+        self._posti = asyncio.Semaphore(in_volo)
+        self._task = set()
+        self._fermo = asyncio.Event()
+
+    def comando(self, nome: str, handler) -> None:
+        self._comandi[nome] = handler
+
+    def callback(self, pattern: str, handler) -> None:
+        self._callback.append((re.compile(pattern), handler))
+
+    # ─── Dispatch ─────────────────────────────────────────────────────────────
+    def _trova(self, update):
+        if update.callback_query is not None and update.callback_query.data:
+            for regex, handler in self._callback:
+                if regex.match(update.callback_query.data):
+                    return handler, []
+        msg = update.message
+        if msg is not None and msg.text and msg.text.startswith("/"):
+            parole = msg.text.split()
+            nome = parole[0][1:].split("@", 1)[0]
+            if nome in self._comandi:
+                return self._comandi[nome], parole[1:]
+        return None, None
+
+    async def gestisci(self, dati: dict) -> None:
+        """Esegue l'handler di un update (dict JSON della Bot API)."""
+        update = Update.de_json(dati, self.bot)
+        handler, args = self._trova(update)
+        if handler is None:
+            return
+        context = SimpleNamespace(args=args, bot=self.bot)
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(update, context)
+            else:
+                await asyncio.get_running_loop().run_in_executor(self._pool, handler, update, context)
+        except Exception as e:
+            logging.exception(f"Errore nell'handler {handler.__name__}: {e}")
+
+    async def _gestisci_e_libera(self, dati: dict) -> None:
+        try:
+            await self.gestisci(dati)
+        finally:
+            self._posti.release()
+
+    async def accoda(self, dati: dict) -> None:
+        """Avvia la gestione di un update; attende se ce ne sono già troppi in volo."""
+        await self._posti.acquire()
+        task = asyncio.get_running_loop().create_task(self._gestisci_e_libera(dati))
+        self._task.add(task)
+        task.add_done_callback(self._task.discard)
+
+    def in_executor(self, funzione, *args):
+        """Esegue una funzione bloccante (file, SQLite, grafici) nel pool dei thread."""
+        return asyncio.get_running_loop().run_in_executor(self._pool, funzione, *args)
+
+    # ─── Long polling ─────────────────────────────────────────────────────────
+    async def polling(self) -> None:
+        # getUpdates è rifiutato finché è impostato un webhook
+        await self.client.chiama("deleteWebhook")
+        offset = None
+        while not self._fermo.is_set():
+            try:
+                updates = await self.client.chiama(
+                    "getUpdates", offset=offset, timeout=POLL_TIMEOUT,
+                    allowed_updates=["message", "callback_query"]
+                )
+            except Exception as e:
+                logging.error(f"getUpdates fallito: {e}")
+                await asyncio.sleep(3)
+                continue
+            for dati in updates:
+                offset = dati["update_id"] + 1
+                await self.accoda(dati)
+
+    async def ferma(self) -> None:
+        """Smette di leggere update e aspetta quelli in lavorazione."""
+        self._fermo.set()
+        if self._task:
+            await asyncio.gather(*self._task, return_exceptions=True)
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,72 @@
+"""Ruota temporizzata (hashed timer wheel) per le scadenze dei poll."""
+import threading
+import time
+
+SLOT = 256           # slot della ruota
+TICK_SECONDI = 15.0  # ampiezza di uno slot: la ruota fa un giro in SLOT * TICK_SECONDI
+
+
+class RuotaTimer:
+    """Scadenze indicizzate per chiave, con inserimento, rimozione e scadenza in O(1).
+
+    Ogni voce finisce nello slot del tick in cui scade, con il numero di
+    giri completi della ruota ancora da attendere. `avanza()` visita solo
+    gli slot dei tick trascorsi dall'ultima chiamata, quindi basta un unico
+    job periodico per qualunque numero di scadenze. La memoria è fissa per
+    gli slot più una voce per chiave: registrare di nuovo la stessa chiave
+    sostituisce la scadenza precedente.
+    """
+
+    def __init__(self, slot: int = SLOT, tick: float = TICK_SECONDI, orologio=time.monotonic) -> None:
+        self.tick = tick
+        self.orologio = orologio
+        self._slot = [dict() for _ in range(slot)]  # chiave -> [giri, dato]
+        self._dove = {}  # chiave -> indice dello slot
+        self._lock = threading.Lock()
+        self._corrente = int(orologio() // tick)  # ultimo tick elaborato
+
+    def __len__(self) -> int:
+        return len(self._dove)
+
+    def aggiungi(self, chiave, tra_secondi: float, dato=None) -> None:
+        """Fa scadere `chiave` tra `tra_secondi` (arrotondati per eccesso al tick)."""
+        with self._lock:
+            self._rimuovi(chiave)
+            scadenza = int(-(-(self.orologio() + tra_secondi) // self.tick))
+            tick = max(scadenza, self._corrente + 1)
+            indice = tick % len(self._slot)
+            giri = (tick - self._corrente - 1) // len(self._slot)
+            self._slot[indice][chiave] = [giri, dato]
+            self._dove[chiave] = indice
+
+    def rimuovi(self, chiave):
+        """Toglie la scadenza di `chiave`; ritorna il suo dato (None se non c'era)."""
+        with self._lock:
+            return self._rimuovi(chiave)
+
+    def _rimuovi(self, chiave):
+        indice = self._dove.pop(chiave, None)
+        if indice is None:
+            return None
+        return self._slot[indice].pop(chiave)[1]
+
+    def avanza(self) -> list:
+        """Fa avanzare la ruota fino ad adesso; ritorna le (chiave, dato) scadute."""
+        scadute = []
+        with self._lock:
+            adesso = int(self.orologio() // self.tick)
+            n = len(self._slot)
+            # anche dopo una pausa più lunga di un giro ogni slot si visita una volta
+            for t in range(max(self._corrente + 1, adesso - n + 1), adesso + 1):
+                slot = self._slot[t % n]
+                # quante volte questo slot è stato raggiunto dall'ultima chiamata
+                passaggi = (t - self._corrente - 1) // n + 1
+                for chiave, voce in list(slot.items()):
+                    if voce[0] < passaggi:
+                        del slot[chiave]
+                        del self._dove[chiave]
+                        scadute.append((chiave, voce[1]))
+                    else:
+                        voce[0] -= passaggi
+            self._corrente = max(self._corrente, adesso)
+        return scadute
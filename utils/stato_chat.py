@@ -0,0 +1,146 @@
+"""Stato di giornata per chat (blocchi vuoti di fila), aggiornato a ogni evento."""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from utils.studio_store import VIVA, Voce
+
+STATO_CHAT_FILE = "stato_chat.json"  # istantanea dei blocchi vuoti di fila per chat
+
+
+class StatoChat:
+    """Per ogni chat, lo stato di oggi ricavato dalle voci di studio.
+
+    Ogni voce registrata aggiorna in O(1) i blocchi a zero di fila della
+    giornata, così la proposta di adattamento non rilegge il log a ogni
+    risposta. Scrittura sul log e aggiornamento avvengono sotto lo stesso
+    lock, quindi le voci si applicano nell'ordine dei loro id. I totali in minuti restano solo nei rollup
+    (utils.rollup), l'unica fonte per /status, grafici e controllo di metà
+    giornata. Lo stato riguarda un solo giorno: alla prima voce (o lettura)
+    del giorno dopo riparte da zero. Un annullamento ricalcola solo la sua
+    chat dalle voci di oggi.
+
+    `salva()` scrive un'istantanea su file con l'id dell'ultima voce
+    applicata; `carica()` la riprende e applica solo le voci successive e
+    gli annullamenti fatti dopo, oppure ricostruisce tutto dalle voci di oggi.
+    """
+
+    def __init__(self, studio, path: str = STATO_CHAT_FILE) -> None:
+        self.studio = studio
+        self.path = path
+        self.giorno = None
+        self._chat = {}     # chat_id -> blocchi vuoti di fila
+        self._evento = 0    # id più alto applicato
+        self._lock = threading.Lock()
+
+    # ─── Aggiornamento ────────────────────────────────────────────────────────
+    def aggiungi(self, chat_id: int, minuti: int, ts: str = None) -> Voce:
+        """Registra i minuti sul log (StudioStore.aggiungi) e applica la voce."""
+        with self._lock:
+            v = self.studio.aggiungi(chat_id, minuti, ts)
+            self._applica(v)
+        return v
+
+    def _applica(self, v: Voce) -> None:
+        giorno = v.ts[:10]
+        if self.giorno is None or giorno > self.giorno:
+            self._nuovo_giorno(giorno)
+        elif giorno < self.giorno:
+            return
+        self._chat[v.chat_id] = self._chat.get(v.chat_id, 0) + 1 if v.minuti == 0 else 0
+        if v.id is not None:
+            self._evento = max(self._evento, v.id)
+
+    def _nuovo_giorno(self, giorno: str) -> None:
+        self.giorno = giorno
+        self._chat = {}
+
+    def annulla(self, v: Voce) -> bool:
+        """Annulla la voce sul log e ricalcola la sua chat dalle voci di oggi. False se era già annullata."""
+        with self._lock:
+            if not self.studio.annulla(v):
+                return False
+            if v.ts[:10] == self.giorno:
+                self._ricalcola(v.chat_id)
+        return True
+
+    def _ricalcola(self, chat_id: int) -> None:
+        self._chat.pop(chat_id, None)
+        for v in self.studio.voci(chat_id, self.giorno):
+            self._applica(v)
+
+    # ─── Letture ──────────────────────────────────────────────────────────────
+    def _oggi(self, giorno: str) -> dict:
+        if giorno != self.giorno:
+            return {}
+        return self._chat
+
+    def vuoti_di_fila(self, chat_id: int, giorno: str) -> int:
+        """Blocchi a zero registrati di fila, fino all'ultima voce del giorno."""
+        with self._lock:
+            return self._oggi(giorno).get(chat_id, 0)
+
+    # ─── Istantanea ───────────────────────────────────────────────────────────
+    def salva(self) -> None:
+        """Scrive (in modo atomico) lo stato su file."""
+        with self._lock:
+            dati = {
+                "giorno": self.giorno,
+                "evento": self._evento,
+                "salvato": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "chat": {str(cid): n for cid, n in self._chat.items()},
+            }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dati, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def carica(self, giorno: str = None) -> None:
+        """Riprende l'istantanea e la riallinea al log, o ricostruisce da zero le voci di `giorno`."""
+        giorno = giorno or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            self._nuovo_giorno(giorno)
+            self._evento = 0
+            dati = self._leggi()
+            if dati is not None and dati.get("giorno") == giorno:
+                try:
+                    self._evento = int(dati["evento"])
+                    salvato = str(dati["salvato"])
+                    self._chat = {int(cid): int(n) for cid, n in dati["chat"].items()}
+                except (KeyError, TypeError, ValueError) as e:
+                    logging.warning(f"Istantanea {self.path} in un formato diverso, ricostruisco dal log: {e}")
+                    dati = None
+            if dati is None or dati.get("giorno") != giorno:
+                self._nuovo_giorno(giorno)
+                self._evento = 0
+                for v in self.studio.voci_giorno(giorno):
+                    self._applica(v)
+                logging.info(f"Stato chat ricostruito dal log: {len(self._chat)} chat attive oggi.")
+                return
+            nuove = [Voce(*r) for r in self.studio.db.query(
+                "SELECT ts, chat_id, minuti, id FROM eventi_studio "
+                f"WHERE giorno = ? AND id > ? AND {VIVA} ORDER BY id", (giorno, self._evento)
+            )]
+            for v in nuove:
+                self._applica(v)
+            # annullamenti successivi all'istantanea (i tombstone compattati erano già inclusi)
+            annullate = [r[0] for r in self.studio.db.query(
+                "SELECT DISTINCT e.chat_id FROM tombstone t JOIN eventi_studio e ON e.id = t.evento_id "
+                "WHERE t.ts >= ? AND e.giorno = ?", (salvato, giorno)
+            )]
+            for cid in annullate:
+                self._ricalcola(cid)
+            logging.info(f"Stato chat ripreso da {self.path}: {len(nuove)} voci e "
+                         f"{len(annullate)} chat con annullamenti riapplicate.")
+
+    def _leggi(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Istantanea {self.path} illeggibile, ricostruisco dal log: {e}")
+            return None
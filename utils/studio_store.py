@@ -0,0 +1,123 @@
+"""Registrazioni di studio su SQLite, interrogate per (chat_id, giorno)."""
+import logging
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from utils import rollup
+
+# una registrazione di studio: timestamp "YYYY-MM-DD HH:MM:SS", chat, minuti
+# e id della riga nel database (None per voci lette dal vecchio file di testo)
+Voce = namedtuple("Voce", ["ts", "chat_id", "minuti", "id"], defaults=[None])
+
+# condizione che esclude le voci annullate (tombstone sull'id)
+VIVA = "NOT EXISTS (SELECT 1 FROM tombstone t WHERE t.evento_id = eventi_studio.id)"
+
+RIGA_RE = re.compile(
+    r'^(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - chat_id: (?P<cid>-?\d+) - minuti_studio: (?P<min>\d+)$'
+)
+
+
+def formatta_voce(v: Voce) -> str:
+    """Riga di log (senza a capo) nel formato di sentinel_studio_log.txt."""
+    return f"{v.ts} - chat_id: {v.chat_id} - minuti_studio: {v.minuti}"
+
+
+def parse_riga(line: str):
+    """Ritorna la Voce di una riga di log, o None se la riga non è valida."""
+    m = RIGA_RE.match(line.strip())
+    if not m:
+        return None
+    return Voce(m.group("ts"), int(m.group("cid")), int(m.group("min")))
+
+
+class StudioStore:
+    """Query sulle registrazioni di studio della tabella eventi_studio.
+
+    Ogni metodo è una sola query su un indice ((chat_id, giorno) o giorno),
+    quindi il costo non dipende da quanta storia è stata accumulata. I totali
+    vengono dai rollup (utils.rollup), aggiornati nella stessa transazione di
+    ogni scrittura e annullamento.
+
+    Le voci non vengono mai cancellate dai percorsi di scrittura: annullare
+    aggiunge un tombstone con l'id della voce, che le letture ignorano, e
+    `compatta()` elimina fisicamente le voci annullate a parte, a blocchi.
+    """
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    # ─── Scrittura ────────────────────────────────────────────────────────────
+    def aggiungi(self, chat_id: int, minuti: int, ts: str = None) -> Voce:
+        """Registra minuti di studio per una chat."""
+        ts = ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.db.transazione() as c:
+            cur = c.execute(
+                "INSERT INTO eventi_studio (ts, giorno, chat_id, minuti) VALUES (?, ?, ?, ?)",
+                (ts, ts[:10], int(chat_id), int(minuti))
+            )
+            rollup.aggiorna(c, ts, int(chat_id), int(minuti))
+        return Voce(ts, int(chat_id), int(minuti), cur.lastrowid)
+
+    def annulla(self, v: Voce) -> bool:
+        """Annulla una voce aggiungendo il suo tombstone. False se era già annullata."""
+        with self.db.transazione() as c:
+            riga = c.execute(
+                f"SELECT ts, chat_id, minuti FROM eventi_studio WHERE id = ? AND {VIVA}", (v.id,)
+            ).fetchone()
+            if not riga:
+                return False
+            c.execute(
+                "INSERT INTO tombstone (evento_id, ts) VALUES (?, ?)",
+                (v.id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            rollup.aggiorna(c, riga[0], riga[1], -riga[2])
+        return True
+
+    def compatta(self, blocco: int = 500) -> int:
+        """Elimina le voci annullate e i loro tombstone, `blocco` alla volta.
+
+        Ogni blocco è una transazione breve, così le scritture degli handler
+        non restano in attesa durante la compattazione. Ritorna le voci eliminate.
+        """
+        totale = 0
+        while True:
+            with self.db.transazione() as c:
+                ids = [(r[0],) for r in c.execute(
+                    "SELECT evento_id FROM tombstone ORDER BY evento_id LIMIT ?", (blocco,)
+                )]
+                if not ids:
+                    break
+                c.executemany("DELETE FROM eventi_studio WHERE id = ?", ids)
+                c.executemany("DELETE FROM tombstone WHERE evento_id = ?", ids)
+            totale += len(ids)
+        if totale:
+            logging.info(f"Compattazione log di studio: eliminate {totale} voci annullate.")
+        return totale
+
+    # ─── Query ────────────────────────────────────────────────────────────────
+    def totale(self, chat_id: int, giorno: str) -> int:
+        """Minuti studiati da una chat in un giorno ("YYYY-MM-DD")."""
+        return rollup.totale(self.db, "day", giorno, chat_id)
+
+    def voci(self, chat_id: int, giorno: str) -> list:
+        """Voci di una chat in un giorno, in ordine di scrittura."""
+        return [Voce(*r) for r in self.db.query(
+            "SELECT ts, chat_id, minuti, id FROM eventi_studio "
+            f"WHERE chat_id = ? AND giorno = ? AND {VIVA} ORDER BY id", (chat_id, giorno)
+        )]
+
+    def voci_giorno(self, giorno: str) -> list:
+        """Voci di tutte le chat in un giorno, in ordine di scrittura."""
+        return [Voce(*r) for r in self.db.query(
+            "SELECT ts, chat_id, minuti, id FROM eventi_studio "
+            f"WHERE giorno = ? AND {VIVA} ORDER BY id", (giorno,)
+        )]
+
+    def ultime(self, chat_id: int, n: int = 1) -> list:
+        """Le ultime n voci registrate da una chat (la più recente per ultima)."""
+        righe = self.db.query(
+            "SELECT ts, chat_id, minuti, id FROM eventi_studio "
+            f"WHERE chat_id = ? AND {VIVA} ORDER BY id DESC LIMIT ?", (chat_id, n)
+        )
+        return [Voce(*r) for r in reversed(righe)]
@@ -0,0 +1,64 @@
+"""Tabella minuto del giorno -> destinatari dei reminder, aggiornata per chat."""
+import threading
+from collections import namedtuple
+
+# un blocco del piano da inviare a una chat
+Blocco = namedtuple("Blocco", ["modalita", "orario", "testo"])
+
+
+class TabellaReminder:
+    """Per ogni minuto del giorno, le chat che hanno un blocco in quel minuto.
+
+    Il dispatcher la consulta una volta al minuto con `dovuti(minuto)`: il
+    costo non dipende da quante chat o blocchi ci sono negli altri minuti.
+    Ogni chat è registrata con la sua modalità e il piano compilato usato;
+    `imposta_chat` riscrive solo le righe di quella chat e non fa nulla se
+    modalità e piano (lo stesso oggetto della PianoCache) non sono cambiati.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._minuti = {}  # minuto -> {chat_id: [Blocco, ...]}
+        self._chat = {}    # chat_id -> (modalità, PianoCompilato)
+
+    def imposta_chat(self, chat_id: int, modalita: str, piano) -> bool:
+        """Allinea i blocchi della chat al piano; True se la tabella è cambiata."""
+        with self._lock:
+            attuale = self._chat.get(chat_id)
+            if attuale is not None and attuale[0] == modalita and attuale[1] is piano:
+                return False
+            self._togli(chat_id)
+            for minuto, (orario, testo) in zip(piano.minuti, piano.blocchi):
+                self._minuti.setdefault(minuto, {}).setdefault(chat_id, []).append(
+                    Blocco(modalita, orario, testo))
+            self._chat[chat_id] = (modalita, piano)
+            return True
+
+    def rimuovi_chat(self, chat_id: int) -> bool:
+        with self._lock:
+            return self._togli(chat_id)
+
+    def _togli(self, chat_id: int) -> bool:
+        attuale = self._chat.pop(chat_id, None)
+        if attuale is None:
+            return False
+        for minuto in set(attuale[1].minuti):
+            riga = self._minuti[minuto]
+            riga.pop(chat_id, None)
+            if not riga:
+                del self._minuti[minuto]
+        return True
+
+    def chat(self) -> set:
+        with self._lock:
+            return set(self._chat)
+
+    def dovuti(self, minuto: int) -> dict:
+        """chat_id -> blocchi da inviare nel minuto del giorno `minuto` (0-1439)."""
+        with self._lock:
+            return {cid: list(blocchi) for cid, blocchi in self._minuti.get(minuto, {}).items()}
+
+    def voci(self) -> int:
+        """Numero di coppie (chat, blocco) in tabella."""
+        with self._lock:
+            return sum(len(b) for riga in self._minuti.values() for b in riga.values())
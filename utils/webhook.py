@@ -0,0 +1,205 @@
+"""Server webhook integrato: riceve gli update via HTTP e li passa agli handler."""
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HEADER_SEGRETO = "X-Telegram-Bot-Api-Secret-Token"
+MAX_CORPO = 1 << 20   # byte accettati per richiesta (un batch di update)
+CODA_MAX = 1000       # update in attesa prima di rispondere 503
+WORKERS = 4
+CAMPIONI = 1000       # latenze tenute per i percentili
+
+
+def carica_segreto(path: str) -> str:
+    """Legge il secret token del webhook; al primo avvio lo genera e lo salva."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    segreto = secrets.token_urlsafe(32)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(segreto)
+    return segreto
+
+
+class Latenze:
+    """Latenze ingresso → risposta degli ultimi `CAMPIONI` update."""
+
+    def __init__(self, campioni: int = CAMPIONI) -> None:
+        self._lock = threading.Lock()
+        self._ms = deque(maxlen=campioni)
+        self.totale = 0
+        self.errori = 0
+        self.rifiutati = 0  # update respinti con 503 a coda piena
+
+    def registra(self, ms: float, ok: bool) -> None:
+        with self._lock:
+            self._ms.append(ms)
+            self.totale += 1
+            if not ok:
+                self.errori += 1
+
+    def riepilogo(self) -> dict:
+        with self._lock:
+            ordinati = sorted(self._ms)
+            riepilogo = {"update": self.totale, "errori": self.errori, "rifiutati": self.rifiutati}
+        if ordinati:
+            def perc(p):
+                return round(ordinati[min(len(ordinati) - 1, int(p * len(ordinati)))], 1)
+            riepilogo.update(p50_ms=perc(0.5), p95_ms=perc(0.95), max_ms=round(ordinati[-1], 1))
+        return riepilogo
+
+
+class ServerWebhook:
+    """Server HTTP che accoda gli update e li fa gestire da pochi worker.
+
+    Ogni POST su `percorso` deve avere l'header del secret token; il corpo è
+    un update JSON o una lista di update (batch). Gli update entrano in una
+    coda limitata a `coda_max`: se un batch non ci sta tutto la richiesta è
+    respinta con 503 e Retry-After, così Telegram (o chi invia) la ripete
+    più tardi invece di far crescere la memoria. I worker chiamano
+    `processa(update_dict)`, che ritorna quando la risposta è stata inviata:
+    il tempo da quando la richiesta è arrivata a quel momento è la latenza
+    ingresso → risposta, riassunta da GET `<percorso>/stats` e nei log.
+    """
+
+    def __init__(self, processa, segreto: str, host: str = "127.0.0.1", porta: int = 8443,
+                 percorso: str = "/webhook", coda_max: int = CODA_MAX, workers: int = WORKERS) -> None:
+        self.processa = processa
+        self.segreto = segreto
+        self.percorso = percorso
+        self.latenze = Latenze()
+        self._coda = queue.Queue(maxsize=coda_max)
+        self._lock_coda = threading.Lock()
+        self._server = ThreadingHTTPServer((host, porta), self._crea_handler())
+        self._server.daemon_threads = True
+        self._threads = [threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True)
+                         for i in range(workers)]
+
+    @property
+    def indirizzo(self):
+        return self._server.server_address
+
+    # ─── Ingresso ─────────────────────────────────────────────────────────────
+    def accoda(self, updates: list, t_ingresso: float) -> bool:
+        """Accoda un batch intero oppure niente; False se la coda è piena."""
+        with self._lock_coda:
+            if self._coda.maxsize - self._coda.qsize() < len(updates):
+                self.latenze.rifiutati += len(updates)
+                return False
+            for dati in updates:
+                self._coda.put_nowait((t_ingresso, dati))
+        return True
+
+    def _crea_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _rispondi(self, codice: int, corpo: dict = None, **header) -> None:
+                dati = json.dumps(corpo or {}).encode("utf-8")
+                self.send_response(codice)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dati)))
+                for k, v in header.items():
+                    self.send_header(k.replace("_", "-"), v)
+                self.end_headers()
+                self.wfile.write(dati)
+
+            def _autorizzato(self) -> bool:
+                ricevuto = self.headers.get(HEADER_SEGRETO, "")
+                return hmac.compare_digest(ricevuto.encode(), server.segreto.encode())
+
+            def do_GET(self):
+                if self.path != server.percorso + "/stats":
+                    return self._rispondi(404)
+                if not self._autorizzato():
+                    return self._rispondi(403)
+                self._rispondi(200, server.latenze.riepilogo())
+
+            def do_POST(self):
+                t_ingresso = time.perf_counter()
+                if self.path != server.percorso:
+                    return self._rispondi(404)
+                if not self._autorizzato():
+                    logging.warning(f"Webhook: secret token errato da {self.client_address[0]}.")
+                    return self._rispondi(403)
+                lunghezza = int(self.headers.get("Content-Length") or 0)
+                if lunghezza > MAX_CORPO:
+                    return self._rispondi(413)
+                try:
+                    corpo = json.loads(self.rfile.read(lunghezza))
+                except ValueError:
+                    return self._rispondi(400)
+                updates = corpo if isinstance(corpo, list) else [corpo]
+                if not all(isinstance(u, dict) and "update_id" in u for u in updates):
+                    return self._rispondi(400)
+                if not server.accoda(updates, t_ingresso):
+                    return self._rispondi(503, Retry_After="1")
+                self._rispondi(200, {"accodati": len(updates)})
+
+            def log_message(self, format, *args):
+                pass  # niente log per ogni richiesta
+
+        return Handler
+
+    # ─── Gestione ─────────────────────────────────────────────────────────────
+    def _worker(self) -> None:
+        while True:
+            voce = self._coda.get()
+            if voce is None:
+                return
+            t_ingresso, dati = voce
+            ok = True
+            try:
+                self.processa(dati)
+            except Exception as e:
+                ok = False
+                logging.error(f"Webhook: errore nell'update {dati.get('update_id')}: {e}")
+            self.latenze.registra((time.perf_counter() - t_ingresso) * 1000, ok)
+            if self.latenze.totale % 100 == 0:
+                logging.info(f"Webhook: {self.latenze.riepilogo()}")
+
+    def avvia(self) -> None:
+        for t in self._threads:
+            t.start()
+        threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True).start()
+        host, porta = self.indirizzo[:2]
+        logging.info(f"Webhook in ascolto su http://{host}:{porta}{self.percorso}")
+
+    def ferma(self) -> None:
+        """Chiude il server, lascia finire la coda e ferma i worker."""
+        self._server.shutdown()
+        self._server.server_close()
+        for _ in self._threads:
+            self._coda.put(None)
+        for t in self._threads:
+            t.join(timeout=10)
+        logging.info(f"Webhook fermato: {self.latenze.riepilogo()}")
+
+
+def invia_registrati(file: str, url: str, segreto: str) -> dict:
+    """POST di update registrati (un update o una lista, in JSON) a un webhook."""
+    with open(file, "rb") as f:
+        corpo = f.read()
+    req = urllib.request.Request(url, data=corpo, method="POST", headers={
+        "Content-Type": "application/json", HEADER_SEGRETO: segreto,
+    })
+    with urllib.request.urlopen(req) as r:
+        return json.loads(r.read() or b"{}")
+
+
+if __name__ == "__main__":
+    # python -m utils.webhook updates.json [url] [file_segreto]
+    if len(sys.argv) < 2:
+        sys.exit("Uso: python -m utils.webhook <updates.json> [url] [file_segreto]")
+    url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:8443/webhook"
+    segreto = carica_segreto(sys.argv[3] if len(sys.argv) > 3 else "webhook_secret.txt")
+    print(invia_registrati(sys.argv[1], url, segreto))
@@ -0,0 +1,123 @@
+"""Registro chat e contatori dei miss in memoria, salvati in differita."""
+import logging
+import threading
+import time
+
+FINESTRA_SECONDI = 0.5
+
+
+class RegistroChat:
+    """Chat attive e miss per chat, letti e scritti in memoria.
+
+    Gli handler modificano solo i dizionari in memoria e segnano la chat come
+    "sporca"; un thread di sfondo aspetta `finestra` secondi dopo la prima
+    modifica, così da raccogliere tutta la raffica, e scrive le differenze in
+    un'unica transazione SQLite (atomica: o tutto o niente). `chiudi()`
+    scarica quanto resta prima dello spegnimento.
+    """
+
+    def __init__(self, db, finestra: float = FINESTRA_SECONDI) -> None:
+        self.db = db
+        self.finestra = finestra
+        self._lock = threading.Lock()
+        self._attive = {cid: bool(a) for cid, a in db.query("SELECT chat_id, attiva FROM chat")}
+        self._misses = {cid: n for cid, n in db.query("SELECT chat_id, conteggio FROM misses")}
+        self._chat_sporche = set()
+        self._misses_sporchi = set()
+        self._modificato = threading.Event()
+        self._fermo = False
+        self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # ─── Chat ─────────────────────────────────────────────────────────────────
+    def chat_attive(self) -> list:
+        with self._lock:
+            return [cid for cid, attiva in self._attive.items() if attiva]
+
+    def chat_attiva(self, chat_id: int) -> bool:
+        with self._lock:
+            return self._attive.get(chat_id, False)
+
+    def imposta_chat(self, chat_id: int, attiva: bool) -> None:
+        with self._lock:
+            if self._attive.get(chat_id) == attiva:
+                return
+            self._attive[chat_id] = attiva
+            self._chat_sporche.add(chat_id)
+        self._modificato.set()
+
+    def chat_attive_per_modalita(self) -> dict:
+        """modalità -> [chat_id] delle chat attive (senza modalità = "normale")."""
+        modalita = dict(self.db.query("SELECT chat_id, modalita FROM piano_chat"))
+        gruppi = {}
+        for cid in self.chat_attive():
+            gruppi.setdefault(modalita.get(cid, "normale"), []).append(cid)
+        return gruppi
+
+    # ─── Miss ─────────────────────────────────────────────────────────────────
+    def misses(self, chat_id: int) -> int:
+        with self._lock:
+            return self._misses.get(chat_id, 0)
+
+    def azzera_misses(self, chat_id: int) -> None:
+        with self._lock:
+            if not self._misses.get(chat_id):
+                return
+            self._misses[chat_id] = 0
+            self._misses_sporchi.add(chat_id)
+        self._modificato.set()
+
+    def incrementa_misses(self, chat_id: int) -> int:
+        with self._lock:
+            n = self._misses[chat_id] = self._misses.get(chat_id, 0) + 1
+            self._misses_sporchi.add(chat_id)
+        self._modificato.set()
+        return n
+
+    # ─── Scrittura differita ──────────────────────────────────────────────────
+    def flush(self) -> None:
+        """Scrive subito su database tutte le modifiche pendenti."""
+        with self._lock:
+            chat = [(cid, int(self._attive[cid])) for cid in self._chat_sporche]
+            misses = [(cid, self._misses[cid]) for cid in self._misses_sporchi]
+            self._chat_sporche.clear()
+            self._misses_sporchi.clear()
+        if not chat and not misses:
+            return
+        try:
+            with self.db.transazione() as c:
+                c.executemany(
+                    "INSERT INTO chat (chat_id, attiva) VALUES (?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET attiva = excluded.attiva", chat
+                )
+                c.executemany("DELETE FROM misses WHERE chat_id = ?",
+                              [(cid,) for cid, n in misses if n == 0])
+                c.executemany("INSERT OR REPLACE INTO misses (chat_id, conteggio) VALUES (?, ?)",
+                              [(cid, n) for cid, n in misses if n])
+        except Exception as e:
+            logging.error(f"Errore salvataggio registro chat: {e}")
+            # rimetto le chat tra le sporche: ci riprovo al prossimo giro
+            with self._lock:
+                self._chat_sporche.update(cid for cid, _ in chat)
+                self._misses_sporchi.update(cid for cid, _ in misses)
+            self._modificato.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._modificato.wait()
+            if self._fermo:
+                return
+            # raccolgo le altre modifiche della stessa raffica
+            time.sleep(self.finestra)
+            self._modificato.clear()
+            self.flush()
+            # chiudi() arrivato durante l'attesa: il suo set() è stato appena cancellato
+            if self._fermo:
+                return
+
+    def chiudi(self) -> None:
+        """Ferma il thread di scrittura e salva le ultime modifiche."""
+        self._fermo = True
+        self._modificato.set()
+        self._thread.join(timeout=5)
+        self.flush()